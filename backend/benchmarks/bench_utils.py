@@ -0,0 +1,81 @@
+"""
+bench_utils.py
+Shared helpers for the backend benchmark scripts.
+Run the benchmarks from the backend directory, e.g. `python -m benchmarks.inference_resolution`.
+"""
+
+import os
+import time
+import tempfile
+from collections import defaultdict
+import numpy as np
+
+from main.object_tracking import detect_and_track
+
+MALL_VIDEO = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../testing/Mall.mp4'))
+
+def run_tracking(video_path=MALL_VIDEO, **kwargs):
+    """
+    Run detect_and_track into a temporary output video.
+
+    Returns:
+        Tuple of (detections, fps, seconds, stats)
+    """
+    stats = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        _, detections, fps = detect_and_track(video_path, os.path.join(tmp, 'out.mp4'), stats=stats, **kwargs)
+        seconds = time.perf_counter() - start
+    return detections, fps, seconds, stats
+
+def boxes_by_frame(detections):
+    """Group detection bounding boxes by frame number."""
+    frames = defaultdict(list)
+    for det in detections:
+        frames[det['frame']].append(det['bbox'])
+    return frames
+
+def iou(a, b):
+    """Intersection over union of two [x1, y1, x2, y2] boxes."""
+    ix = max(0, min(a[2], b[2]) - max(a[0], b[0]))
+    iy = max(0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = ix * iy
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+def compare_to_reference(reference, candidate, iou_threshold=0.5):
+    """
+    Compare a detection run against a reference run of the same video.
+
+    Returns:
+        dict with box recall (share of reference boxes matched by IoU),
+        mean absolute per-frame count error and the visitor counts of both runs
+    """
+    ref_frames = boxes_by_frame(reference)
+    cand_frames = boxes_by_frame(candidate)
+    matched = 0
+    total = 0
+    count_errors = []
+    for frame in set(ref_frames) | set(cand_frames):
+        ref_boxes = ref_frames.get(frame, [])
+        cand_boxes = list(cand_frames.get(frame, []))
+        count_errors.append(abs(len(ref_boxes) - len(cand_boxes)))
+        total += len(ref_boxes)
+        for box in ref_boxes:
+            best = max(range(len(cand_boxes)), key=lambda i: iou(box, cand_boxes[i]), default=None)
+            if best is not None and iou(box, cand_boxes[best]) >= iou_threshold:
+                matched += 1
+                cand_boxes.pop(best)
+    return {
+        'box_recall': round(matched / total, 3) if total else None,
+        'count_mae': round(float(np.mean(count_errors)), 3) if count_errors else 0.0,
+        'reference_visitors': len(set(d['track_id'] for d in reference)),
+        'visitors': len(set(d['track_id'] for d in candidate))
+    }
+
+def print_table(rows, columns):
+    """Print a list of dicts as an aligned text table."""
+    widths = [max(len(str(col)), *(len(str(row.get(col, ''))) for row in rows)) for col in columns]
+    print('  '.join(str(col).ljust(w) for col, w in zip(columns, widths)))
+    for row in rows:
+        print('  '.join(str(row.get(col, '')).ljust(w) for col, w in zip(columns, widths)))
@@ -0,0 +1,112 @@
+"""
+detection_store.py
+Time and peak memory of loading a job's detections from detections.json versus the columnar store.
+
+Each variant loads the detections of a synthetic job and answers a 10 minute
+time range query (count and distinct visitors), as the export and analysis
+endpoints do. The columnar store is queried both with a boolean mask over the
+whole table and with its time index (binary search, see time_slice).
+Peak memory is measured with tracemalloc; pages of the memory-mapped table
+are read by the OS and not counted, which is the point.
+
+Usage (from the backend directory):
+    python -m benchmarks.detection_store [--detections 2000000] [--repeats 3]
+"""
+
+import os
+import json
+import time
+import argparse
+import tempfile
+import tracemalloc
+import numpy as np
+
+from main import detection_store
+from .bench_utils import print_table
+
+def synthetic_detections(num_detections, fps=25, people_per_frame=20, seed=0):
+    """Detections of people_per_frame boxes per frame, with track IDs that change every few hundred frames."""
+    rng = np.random.default_rng(seed)
+    frames = np.arange(num_detections) // people_per_frame
+    track_ids = (np.arange(num_detections) % people_per_frame) + (frames // 300) * people_per_frame
+    x1 = rng.integers(0, 1800, num_detections)
+    y1 = rng.integers(0, 900, num_detections)
+    return [
+        {'frame': int(frame), 'bbox': [int(x), int(y), int(x) + 60, int(y) + 160],
+         'track_id': str(track_id), 'timestamp': frame / fps}
+        for frame, track_id, x, y in zip(frames, track_ids, x1, y1)
+    ]
+
+def query_json(job_dir, start_time, end_time):
+    """The previous path: json.load the whole file and filter the dicts."""
+    with open(os.path.join(job_dir, detection_store.LEGACY_DETECTIONS_FILE), 'r') as f:
+        detections = json.load(f)['detections']
+    selected = [det for det in detections if 'timestamp' in det and start_time <= det['timestamp'] <= end_time]
+    return len(selected), len(set(det['track_id'] for det in selected))
+
+def query_store_mask(job_dir, start_time, end_time):
+    table, _ = detection_store.load_detections(job_dir)
+    timestamps = table['timestamp']
+    selected = table[(timestamps >= start_time) & (timestamps <= end_time)]
+    return len(selected), len(np.unique(selected['track_id']))
+
+def query_store_index(job_dir, start_time, end_time):
+    table, _ = detection_store.load_detections(job_dir)
+    selected = detection_store.time_slice(table, start_time, end_time)
+    return len(selected), len(np.unique(selected['track_id']))
+
+def measure(query, job_dir, start_time, end_time, repeats):
+    """Best time and peak traced memory of a query function."""
+    seconds = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = query(job_dir, start_time, end_time)
+        seconds.append(time.perf_counter() - start)
+    tracemalloc.start()
+    query(job_dir, start_time, end_time)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(seconds), peak, result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--detections', type=int, default=2000000)
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    detections = synthetic_detections(args.detections)
+    duration = detections[-1]['timestamp']
+    start_time, end_time = duration / 2, duration / 2 + 600
+
+    rows = []
+    with tempfile.TemporaryDirectory() as job_dir:
+        json_path = os.path.join(job_dir, detection_store.LEGACY_DETECTIONS_FILE)
+        with open(json_path, 'w') as f:
+            json.dump({'fps': 25, 'detections': detections}, f)
+        del detections
+        start = time.perf_counter()
+        detection_store.load_detections(job_dir)  # one-off conversion
+        conversion_seconds = time.perf_counter() - start
+
+        table_path = os.path.join(job_dir, detection_store.DETECTIONS_FILE)
+        for label, query, path in (
+            ('detections.json', query_json, json_path),
+            ('store, mask', query_store_mask, table_path),
+            ('store, time index', query_store_index, table_path)
+        ):
+            seconds, peak, result = measure(query, job_dir, start_time, end_time, args.repeats)
+            rows.append({
+                'format': label,
+                'file_mb': round(os.path.getsize(path) / 2 ** 20, 1),
+                'seconds': round(seconds, 3),
+                'peak_mb': round(peak / 2 ** 20, 1),
+                'detections': result[0],
+                'visitors': result[1]
+            })
+
+    print(f"{args.detections} detections, 10 minute range query, best of {args.repeats}")
+    print(f"One-off conversion of detections.json: {conversion_seconds:.2f} s")
+    print_table(rows, ['format', 'file_mb', 'seconds', 'peak_mb', 'detections', 'visitors'])
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+heatmap_render.py
+Time and peak memory of rendering a heatmap over 1080p and 4K floorplans.
+
+Compares render_heatmap (reduced-resolution blur, uint8 blend with float32
+weights) against the previous full-resolution path (scipy gaussian_filter,
+float64 blend), on a synthetic canvas of clustered detection counts.
+Peak memory is measured with tracemalloc, which sees all NumPy and OpenCV
+output arrays but not OpenCV's internal scratch buffers.
+
+Usage (from the backend directory):
+    python -m benchmarks.heatmap_render [--detections 200000] [--repeats 3]
+"""
+
+import os
+import time
+import argparse
+import tempfile
+import tracemalloc
+import cv2
+import numpy as np
+from scipy.ndimage import gaussian_filter
+
+from main.heatmap_maker import render_heatmap, spread_density
+from .bench_utils import print_table
+
+SIZES = {'1080p': (1080, 1920), '4K': (2160, 3840)}
+
+def reference_render(heatmap, floorplan, output_heatmap_path):
+    """The full-resolution render path used before render_heatmap was optimized."""
+    heatmap = spread_density(heatmap)
+    heatmap = np.power(heatmap, 0.6)
+    heatmap_norm = cv2.normalize(heatmap, None, 0, 1, cv2.NORM_MINMAX)
+    heatmap_img = cv2.normalize(heatmap, None, 0, 255, cv2.NORM_MINMAX)
+    heatmap_img = gaussian_filter(heatmap_img, sigma=10)
+    heatmap_colored = cv2.applyColorMap(heatmap_img.astype(np.uint8), cv2.COLORMAP_TURBO)
+    alpha_mask = heatmap_norm[..., None] * 0.7
+    blended = (floorplan * (1 - alpha_mask) + heatmap_colored * alpha_mask).astype(np.uint8)
+    cv2.imwrite(output_heatmap_path, blended)
+    return blended
+
+def synthetic_inputs(shape, num_detections, seed=0):
+    """Canvas of detection counts clustered around a few hot spots, and a textured floorplan."""
+    rng = np.random.default_rng(seed)
+    height, width = shape
+    hot_spots = rng.uniform([0, 0], [height, width], size=(8, 2))
+    points = hot_spots[rng.integers(0, len(hot_spots), num_detections)]
+    points += rng.normal(0, min(shape) / 12, size=points.shape)
+    points = np.clip(points, 0, [height - 1, width - 1]).astype(np.int64)
+    heatmap = np.zeros(shape, dtype=np.float32)
+    np.add.at(heatmap, (points[:, 0], points[:, 1]), 1.0)
+    floorplan = cv2.GaussianBlur(rng.integers(0, 256, size=shape + (3,), dtype=np.uint8), (0, 0), 3)
+    return heatmap, floorplan
+
+def measure(render, heatmap, floorplan, repeats, output_path):
+    """Best time and peak traced memory of a render function."""
+    render(heatmap, floorplan, output_path)  # warm-up
+    seconds = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        render(heatmap, floorplan, output_path)
+        seconds.append(time.perf_counter() - start)
+    tracemalloc.start()
+    image = render(heatmap, floorplan, output_path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(seconds), peak, image
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--detections', type=int, default=200000)
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        output_path = os.path.join(tmp, 'heatmap.jpg')
+        for name, shape in SIZES.items():
+            heatmap, floorplan = synthetic_inputs(shape, args.detections)
+            ref_seconds, ref_peak, ref_image = measure(reference_render, heatmap, floorplan, args.repeats, output_path)
+            new_seconds, new_peak, new_image = measure(render_heatmap, heatmap, floorplan, args.repeats, output_path)
+            difference = np.abs(ref_image.astype(np.int16) - new_image).mean()
+            for label, seconds, peak in (('reference', ref_seconds, ref_peak), ('render_heatmap', new_seconds, new_peak)):
+                rows.append({
+                    'floorplan': name,
+                    'render': label,
+                    'seconds': round(seconds, 3),
+                    'peak_mb': round(peak / 2 ** 20, 1),
+                    'image_mb': round(floorplan.nbytes / 2 ** 20, 1),
+                    'mean_abs_diff': round(float(difference), 2) if label != 'reference' else ''
+                })
+
+    print(f"{args.detections} detections, best of {args.repeats}")
+    print_table(rows, ['floorplan', 'render', 'seconds', 'peak_mb', 'image_mb', 'mean_abs_diff'])
+
+if __name__ == '__main__':
+    main()
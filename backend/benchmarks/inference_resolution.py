@@ -0,0 +1,50 @@
+"""
+inference_resolution.py
+Speed/accuracy trade-off of the YOLO inference resolution (imgsz) on testing/Mall.mp4.
+
+The run with YOLO's default input size is the reference; every other size is
+compared against it by box recall, per-frame count error and visitor count.
+
+Usage (from the backend directory):
+    python -m benchmarks.inference_resolution [--sizes 1280 960 640 480 320] [--video PATH]
+"""
+
+import argparse
+
+from .bench_utils import MALL_VIDEO, run_tracking, compare_to_reference, print_table
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--video', default=MALL_VIDEO)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1280, 960, 640, 480, 320])
+    args = parser.parse_args()
+
+    reference, _, ref_seconds, ref_stats = run_tracking(args.video)
+    frames = ref_stats['frames_processed']
+    rows = [{
+        'imgsz': 'default',
+        'seconds': round(ref_seconds, 2),
+        'fps': round(frames / ref_seconds, 1),
+        'speedup': 1.0,
+        'box_recall': 1.0,
+        'count_mae': 0.0,
+        'visitors': len(set(d['track_id'] for d in reference))
+    }]
+    for size in args.sizes:
+        detections, _, seconds, _ = run_tracking(args.video, imgsz=size)
+        comparison = compare_to_reference(reference, detections)
+        rows.append({
+            'imgsz': size,
+            'seconds': round(seconds, 2),
+            'fps': round(frames / seconds, 1),
+            'speedup': round(ref_seconds / seconds, 2),
+            'box_recall': comparison['box_recall'],
+            'count_mae': comparison['count_mae'],
+            'visitors': comparison['visitors']
+        })
+
+    print(f"Video: {args.video} ({frames} frames)")
+    print_table(rows, ['imgsz', 'seconds', 'fps', 'speedup', 'box_recall', 'count_mae', 'visitors'])
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+quantized_detector.py
+Validation report for the INT8-quantized detector against the FP32 ONNX model.
+
+Both models run the full tracking pipeline on the same video. The report
+compares detection counts, visitor totals, box recall and per-frame count
+error (INT8 vs FP32), along with speed and model size.
+
+Usage (from the backend directory):
+    python -m benchmarks.quantized_detector [--video PATH] [--calibration-video PATH]
+"""
+
+import os
+import argparse
+
+from main.model_registry import resolve_weights, DEFAULT_WEIGHTS
+from main.quantization import quantize_detector, REFERENCE_CALIBRATION_VIDEO
+from .bench_utils import MALL_VIDEO, run_tracking, compare_to_reference, print_table
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--video', default=MALL_VIDEO)
+    parser.add_argument('--calibration-video', default=REFERENCE_CALIBRATION_VIDEO)
+    args = parser.parse_args()
+
+    fp32_path = resolve_weights(DEFAULT_WEIGHTS, 'onnx')
+    int8_path = quantize_detector(DEFAULT_WEIGHTS, args.calibration_video)
+
+    fp32, _, fp32_seconds, stats = run_tracking(args.video, backend='onnx')
+    int8, _, int8_seconds, _ = run_tracking(args.video, quantized=True, calibration_video=args.calibration_video)
+    comparison = compare_to_reference(fp32, int8)
+    frames = stats['frames_processed']
+
+    rows = [
+        {
+            'model': 'fp32',
+            'size_mb': round(os.path.getsize(fp32_path) / 1e6, 1),
+            'seconds': round(fp32_seconds, 2),
+            'fps': round(frames / fp32_seconds, 1),
+            'detections': len(fp32),
+            'visitors': comparison['reference_visitors'],
+            'box_recall': 1.0,
+            'count_mae': 0.0
+        },
+        {
+            'model': 'int8',
+            'size_mb': round(os.path.getsize(int8_path) / 1e6, 1),
+            'seconds': round(int8_seconds, 2),
+            'fps': round(frames / int8_seconds, 1),
+            'detections': len(int8),
+            'visitors': comparison['visitors'],
+            'box_recall': comparison['box_recall'],
+            'count_mae': comparison['count_mae']
+        }
+    ]
+    print(f"Video: {args.video} ({frames} frames), calibrated on {args.calibration_video}")
+    print_table(rows, ['model', 'size_mb', 'seconds', 'fps', 'detections', 'visitors', 'box_recall', 'count_mae'])
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""
+stride_tracking.py
+Regression check: people entering mid-clip must be tracked when detection runs on every k-th frame.
+
+A synthetic clip shows one person walking from the first frame and a second
+one entering half-way through. Detection is a colour threshold standing in
+for YOLO, so the check needs no weights and isolates the tracker and the
+stride loop of detect_and_track. Every tracker is run at stride 1, a fixed
+stride and adaptive stride; the check fails if any run misses a person.
+
+Usage (from the backend directory):
+    python -m benchmarks.stride_tracking [--stride 3] [--frames 300]
+"""
+
+import os
+import sys
+import argparse
+import tempfile
+import threading
+from types import SimpleNamespace
+import cv2
+import numpy as np
+import torch
+
+from main import object_tracking
+from main.trackers import TRACKERS
+from .bench_utils import print_table
+
+WIDTH, HEIGHT, FPS = 640, 360, 25
+# Person colours (BGR) and the frame each one enters at, as a fraction of the clip
+PEOPLE = (((0, 0, 255), 0.0), ((0, 255, 0), 0.5))
+PERSON_SIZE = (40, 100)
+
+def write_clip(path, num_frames):
+    """Write the synthetic clip: textured background, people walking left to right."""
+    rng = np.random.default_rng(0)
+    background = cv2.GaussianBlur(rng.integers(60, 200, (HEIGHT, WIDTH, 3), dtype=np.uint8), (0, 0), 2)
+    out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), FPS, (WIDTH, HEIGHT))
+    for frame_number in range(num_frames):
+        frame = background.copy()
+        for index, (color, enter) in enumerate(PEOPLE):
+            start = int(enter * num_frames)
+            if frame_number < start:
+                continue
+            x = 20 + (frame_number - start) * 2
+            y = 60 + index * 140
+            cv2.rectangle(frame, (x, y), (x + PERSON_SIZE[0], y + PERSON_SIZE[1]), color, -1)
+        out.write(frame)
+    out.release()
+
+class _Boxes(SimpleNamespace):
+    def __len__(self):
+        return len(self.conf)
+
+def color_detector(frames, **kwargs):
+    """Stand-in for the YOLO model: one box per person colour found in each frame."""
+    results = []
+    for frame in frames:
+        boxes = []
+        for color, _ in PEOPLE:
+            mask = cv2.inRange(frame, np.clip(np.array(color) - 60, 0, 255), np.clip(np.array(color) + 60, 0, 255))
+            points = cv2.findNonZero(mask)
+            if points is not None and len(points) > 50:
+                x, y, w, h = cv2.boundingRect(points)
+                boxes.append([x, y, x + w, y + h])
+        xyxy = torch.tensor(boxes, dtype=torch.float32).reshape(-1, 4)
+        results.append(SimpleNamespace(boxes=_Boxes(xyxy=xyxy, conf=torch.full((len(boxes),), 0.9))))
+    return results
+
+def people_tracked(detections, num_frames):
+    """
+    Number of people with track records on at least half of the frames they are visible.
+    Records are assigned to people by their lane (vertical position) in the clip.
+    """
+    centers_y = np.array([(det['bbox'][1] + det['bbox'][3]) / 2 for det in detections]).reshape(-1)
+    tracked = 0
+    for index, (_, enter) in enumerate(PEOPLE):
+        lane_y = 60 + index * 140 + PERSON_SIZE[1] / 2
+        records = int(np.sum(np.abs(centers_y - lane_y) < PERSON_SIZE[1] / 2))
+        if records >= (1 - enter) * num_frames / 2:
+            tracked += 1
+    return tracked
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stride', type=int, default=3)
+    parser.add_argument('--frames', type=int, default=300)
+    args = parser.parse_args()
+
+    # Run detect_and_track's real stride loop with the colour detector in place of YOLO
+    object_tracking.load_model = lambda *a, **k: (color_detector, threading.Lock())
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        video_path = os.path.join(tmp, 'clip.mp4')
+        write_clip(video_path, args.frames)
+        for tracker in TRACKERS:
+            for label, options in (
+                ('stride 1', {'detect_stride': 1}),
+                (f'stride {args.stride}', {'detect_stride': args.stride}),
+                ('adaptive', {'adaptive_stride': True})
+            ):
+                stats = {}
+                _, detections, _ = object_tracking.detect_and_track(
+                    video_path, None, tracker=tracker, stats=stats, imgsz=None, **options
+                )
+                tracked = people_tracked(detections, args.frames)
+                rows.append({
+                    'tracker': tracker,
+                    'stride': label,
+                    'records': len(detections),
+                    'tracks': len(set(det['track_id'] for det in detections)),
+                    'people_tracked': f"{tracked}/{len(PEOPLE)}",
+                    'mean_stride': stats.get('mean_stride'),
+                    'ok': tracked == len(PEOPLE)
+                })
+
+    print_table(rows, ['tracker', 'stride', 'records', 'tracks', 'people_tracked', 'mean_stride', 'ok'])
+    if not all(row['ok'] for row in rows):
+        print("FAILED: a person was not tracked")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
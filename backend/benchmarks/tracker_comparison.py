@@ -0,0 +1,59 @@
+"""
+tracker_comparison.py
+Compare the DeepSORT and IoU (ByteTrack-style) trackers on testing/Mall.mp4.
+
+There is no ground truth for the clip, so ID switches are counted from each
+tracker's own output: a switch is a box that overlaps (IoU >= 0.5) a box of
+the previous frame but carries a different track ID, while that previous ID
+is gone from the current frame.
+
+Usage (from the backend directory):
+    python -m benchmarks.tracker_comparison [--video PATH] [--trackers deepsort iou]
+"""
+
+import argparse
+
+from main.trackers import TRACKERS
+from .bench_utils import MALL_VIDEO, run_tracking, iou, print_table
+
+def count_id_switches(detections, iou_threshold=0.5):
+    """Count identity hand-overs between consecutive frames (see module docstring)."""
+    by_frame = {}
+    for det in detections:
+        by_frame.setdefault(det['frame'], []).append(det)
+    switches = 0
+    for frame, current in by_frame.items():
+        previous = by_frame.get(frame - 1)
+        if not previous:
+            continue
+        current_ids = set(det['track_id'] for det in current)
+        for det in current:
+            for prev in previous:
+                if (prev['track_id'] != det['track_id'] and prev['track_id'] not in current_ids
+                        and iou(det['bbox'], prev['bbox']) >= iou_threshold):
+                    switches += 1
+                    break
+    return switches
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--video', default=MALL_VIDEO)
+    parser.add_argument('--trackers', nargs='+', default=list(TRACKERS), choices=TRACKERS)
+    args = parser.parse_args()
+
+    rows = []
+    for name in args.trackers:
+        detections, _, seconds, stats = run_tracking(args.video, tracker=name)
+        rows.append({
+            'tracker': name,
+            'seconds': round(seconds, 2),
+            'fps': round(stats['frames_processed'] / seconds, 1),
+            'visitors': len(set(d['track_id'] for d in detections)),
+            'detections': len(detections),
+            'id_switches': count_id_switches(detections)
+        })
+    print(f"Video: {args.video}")
+    print_table(rows, ['tracker', 'seconds', 'fps', 'visitors', 'detections', 'id_switches'])
+
+if __name__ == '__main__':
+    main()
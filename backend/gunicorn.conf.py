@@ -0,0 +1,20 @@
+"""
+gunicorn.conf.py
+Gunicorn settings for the backend. Picked up automatically when gunicorn is started from this directory.
+"""
+
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+def post_worker_init(worker):
+    """Load the YOLO model once per worker and optionally warm it up with a dummy frame."""
+    if os.getenv('YOLO_WARMUP', 'true').lower() != 'true':
+        return
+    try:
+        from main.model_registry import warm_up_model
+        warm_up_model()
+    except Exception as e:
+        # A failed warm-up only costs latency; the first job will load the model instead
+        logger.error(f"YOLO warm-up failed in worker {worker.pid}: {str(e)}", exc_info=True)
@@ -31,9 +31,24 @@ from io import BytesIO
 # Import from backend files
 from .job_manager import insert_job, get_job, update_job, delete_job, get_jobs_for_user, upload_to_supabase
 from .video_processing import validate_video_file
-from .heatmap_maker import blend_heatmap, analyze_heatmap
+from .heatmap_maker import (
+    analyze_heatmap, accumulate_heatmap, render_heatmap, load_floorplan,
+    spread_density, density_path, save_density, load_density, DEFAULT_REGION_SIZE,
+    SPLAT_RADIUS, RENDER_BLUR_SIGMA, RENDER_PYRAMID_LEVELS
+)
+from .video_overlay import generate_video_overlay
+from .density_cube import (
+    build_density_cube, load_density_cube, range_density, DENSITY_BIN_SECONDS, DENSITY_CELL_SIZE
+)
+from . import render_cache
+from . import detection_store
+from .tiles import build_tile_pyramid, build_previews, tile_path, tiles_dir, image_for_width, image_version
+from .time_series import build_time_series, save_time_series, load_time_series
+from .calibration import load_or_compute_homography, project_detections
 from .utils import hash_password, verify_password
-from .object_tracking import detect_and_track
+from .object_tracking import detect_and_track, DEFAULT_BATCH_SIZE, DEFAULT_DETECT_STRIDE, DEFAULT_MAX_DETECT_STRIDE, DEFAULT_IMGSZ
+from .parallel_tracking import detect_and_track_parallel, DEFAULT_SEGMENT_WORKERS
+from .trackers import DEFAULT_TRACKER, TRACKERS
 from .auth import auth_bp 
 
 # Load environment variables from .env file
@@ -76,11 +91,69 @@ supabase: Client = create_client(url, key)
 # Register the authentication blueprint
 app.register_blueprint(auth_bp)
 
-custom_heatmap_progress = {}
+# Browser/CDN cache lifetime of heatmap tiles and previews (their content never changes)
+HEATMAP_CACHE_MAX_AGE = int(os.getenv('HEATMAP_CACHE_MAX_AGE', str(7 * 24 * 3600)))
+
+# Job ID -> render cache key of the job's most recent custom heatmap request
+latest_custom_heatmap = {}
+
+# Custom heatmap files are named after the parameters they were rendered with,
+# so changing any of them never serves a stale render
+CUSTOM_HEATMAP_RENDER_TAG = render_cache.params_tag({
+    'splat_radius': SPLAT_RADIUS,
+    'blur_sigma': RENDER_BLUR_SIGMA,
+    'pyramid_levels': RENDER_PYRAMID_LEVELS,
+    'bin_seconds': DENSITY_BIN_SECONDS,
+    'cell_size': DENSITY_CELL_SIZE,
+    # Partial bins at the ends of a range are counted exactly (not widened to whole bins)
+    'range_edges': 'exact'
+})
+render_cache.register_pattern(os.path.join(RESULTS_FOLDER, '*', 'custom_heatmap_*'))
+# Renders of other parameters (and untagged ones from before the tag) can never be served again
+render_cache.remove_stale(
+    os.path.join(RESULTS_FOLDER, '*', 'custom_heatmap_*'),
+    [f"custom_heatmap_*_{CUSTOM_HEATMAP_RENDER_TAG}.jpg*", f"custom_heatmap_*_{CUSTOM_HEATMAP_RENDER_TAG}_*"]
+)
 
 def allowed_file(filename, allowed_extensions):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in allowed_extensions
 
+def parse_processing_options(form):
+    """
+    Read the optional per-job processing options from the job creation form.
+    Raises ValueError if an option is invalid.
+    """
+    batch_size = int(form.get('batchSize', DEFAULT_BATCH_SIZE))
+    if batch_size < 1:
+        raise ValueError("batchSize must be at least 1")
+    detect_stride = int(form.get('detectStride', DEFAULT_DETECT_STRIDE))
+    if not 1 <= detect_stride <= DEFAULT_MAX_DETECT_STRIDE:
+        raise ValueError(f"detectStride must be between 1 and {DEFAULT_MAX_DETECT_STRIDE}")
+    adaptive_stride = form.get('adaptiveStride', os.getenv('ADAPTIVE_STRIDE', 'false')).lower() == 'true'
+    motion_gate = form.get('motionGate', os.getenv('MOTION_GATE', 'false')).lower() == 'true'
+    imgsz = int(form.get('imgsz', DEFAULT_IMGSZ))
+    if imgsz and imgsz < 32:
+        raise ValueError("imgsz must be 0 (source resolution) or at least 32")
+    quantized = form.get('quantized', os.getenv('QUANTIZED_DETECTOR', 'false')).lower() == 'true'
+    tracker = form.get('tracker', DEFAULT_TRACKER)
+    if tracker not in TRACKERS:
+        raise ValueError(f"tracker must be one of {', '.join(TRACKERS)}")
+    generate_video = form.get('generateVideo', os.getenv('GENERATE_VIDEO', 'true')).lower() == 'true'
+    segment_workers = int(form.get('segmentWorkers', DEFAULT_SEGMENT_WORKERS))
+    if not 1 <= segment_workers <= (os.cpu_count() or 1):
+        raise ValueError(f"segmentWorkers must be between 1 and {os.cpu_count() or 1}")
+    return {
+        'batch_size': batch_size,
+        'detect_stride': detect_stride,
+        'adaptive_stride': adaptive_stride,
+        'motion_gate': motion_gate,
+        'imgsz': imgsz,
+        'quantized': quantized,
+        'segment_workers': segment_workers,
+        'tracker': tracker,
+        'generate_video': generate_video
+    }
+
 def update_job_status_in_db(job_id, job):
     update_job(job_id, {
         "status": job['status'],
@@ -108,6 +181,7 @@ def process_video_job(job_id):
             points_data = json.load(f)
         cap = validate_video_file(video_path)
         total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        frame_shape = (int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)), int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)))
         cap.release()
 
         # Check for cancellation before starting detection
@@ -119,13 +193,70 @@ def process_video_job(job_id):
 
         # Update status for YOLO detection
         job['message'] = 'Running YOLO detection (0%)'
-        output_video_path, detections, fps = detect_and_track(
-            video_path,
-            job['output_files_expected']['video'],
-            progress_callback=lambda p: update_job_progress(job_id, 'YOLO detection', p),
-            preview_folder=job['output_files_expected']['image'] and os.path.dirname(job['output_files_expected']['image']),
-            cancelled_flag=lambda: job.get('cancelled', False)
-        )
+        processing_stats = {}
+        options = job.get('options', {})
+        tracking_options = {
+            'batch_size': options.get('batch_size', DEFAULT_BATCH_SIZE),
+            'detect_stride': options.get('detect_stride', DEFAULT_DETECT_STRIDE),
+            'adaptive_stride': options.get('adaptive_stride', False),
+            'motion_gate': options.get('motion_gate', False),
+            'imgsz': options.get('imgsz', DEFAULT_IMGSZ),
+            'quantized': options.get('quantized', False),
+            'tracker': options.get('tracker', DEFAULT_TRACKER)
+        }
+        segment_workers = options.get('segment_workers', DEFAULT_SEGMENT_WORKERS)
+        # Detect-only jobs skip all drawing and video encoding
+        generate_video = options.get('generate_video', True)
+        output_video_path = job['output_files_expected']['video'] if generate_video else None
+
+        # Heatmap canvas. With an uploaded floorplan the detections are projected onto it
+        # after tracking; otherwise the floorplan is the first frame and the canvas is
+        # filled while tracking so the video is only decoded once
+        floorplan = load_floorplan(floorplan_path)
+        heatmap = np.zeros(floorplan.shape[:2], dtype=np.float32)
+        homography = None
+        if job.get('floorplan_uploaded'):
+            homography = load_or_compute_homography(
+                os.path.join(RESULTS_FOLDER, job_id, 'homography.json'), points_data, frame_shape, floorplan.shape
+            )
+        if segment_workers > 1:
+            # Track time segments in parallel processes; the workers keep no frames,
+            # so the heatmap and annotated video are rendered from the stitched detections
+            _, detections, fps = detect_and_track_parallel(
+                video_path,
+                segment_workers,
+                progress_callback=lambda p: update_job_progress(job_id, 'YOLO detection', p),
+                cancelled_flag=lambda: job.get('cancelled', False),
+                stats=processing_stats,
+                **tracking_options
+            )
+            if output_video_path and not job.get('cancelled'):
+                generate_video_overlay(
+                    detections,
+                    video_path,
+                    output_video_path,
+                    progress_callback=lambda p: update_job_progress(job_id, 'Rendering video', p)
+                )
+        else:
+            # Single pass: detection, overlay video and heatmap accumulation
+            output_video_path, detections, fps = detect_and_track(
+                video_path,
+                output_video_path,
+                progress_callback=lambda p: update_job_progress(job_id, 'YOLO detection', p),
+                preview_folder=generate_video and os.path.dirname(job['output_files_expected']['image']),
+                cancelled_flag=lambda: job.get('cancelled', False),
+                stats=processing_stats,
+                heatmap=heatmap if homography is None else None,
+                **tracking_options
+            )
+        if homography is not None:
+            # Calibration: foot points of all detections onto the floorplan in one transform
+            project_detections(detections, homography)
+        if segment_workers > 1 or homography is not None:
+            accumulate_heatmap(heatmap, detections)
+        processing_stats['video_generated'] = generate_video
+        processing_stats['floorplan_projected'] = homography is not None
+        job['processing'] = processing_stats
 
         # Check for cancellation after detection
         if job.get('cancelled'):
@@ -134,14 +265,18 @@ def process_video_job(job_id):
             update_job_status_in_db(job_id, job)
             return
 
-        # Save detections and fps to JSON
-        detections_path = os.path.join(RESULTS_FOLDER, job_id, 'detections.json')
-        with open(detections_path, 'w') as f:
-            json.dump({"fps": fps, "detections": detections}, f)
-        upload_to_supabase(job_id, detections_path, "json")
+        # Save detections in the columnar store (sorted by time, memory-mapped on read)
+        detections, track_ids = detection_store.to_table(detections)
+        detections_path, detections_metadata_path = detection_store.save_detections(
+            os.path.join(RESULTS_FOLDER, job_id), detections, track_ids, fps, processing_stats
+        )
+        upload_to_supabase(job_id, detections_path, "npy")
+        upload_to_supabase(job_id, detections_metadata_path, "json")
 
-        # For testing: use static points from Points/floorplan_points.txt
-        points = [[768, 204], [690, 200], [655, 305], [793, 309]]
+        # Precompute the cumulative density cube used for custom time ranges
+        build_density_cube(detections, floorplan.shape[:2], os.path.join(RESULTS_FOLDER, job_id, 'density_cube.npy'))
+        # Cache the per-bin detection and visitor counts used by every analysis
+        save_time_series(build_time_series(detections), os.path.join(RESULTS_FOLDER, job_id, 'timeseries.json'))
 
         # Check for cancellation before heatmap generation
         if job.get('cancelled'):
@@ -150,17 +285,15 @@ def process_video_job(job_id):
             update_job_status_in_db(job_id, job)
             return
 
-        # Now, generate the blended heatmap using blend_heatmap with real detections and points
+        # Render the accumulated heatmap over the floorplan
         output_heatmap_image_path = job['output_files_expected']['image']
-        blend_heatmap(
-            detections,
-            floorplan_path,
-            output_heatmap_image_path,
-            output_video_path,
-            video_path
-        )
+        render_heatmap(heatmap, floorplan, output_heatmap_image_path, density_path(output_heatmap_image_path))
         upload_to_supabase(job_id, output_heatmap_image_path, "jpg")
 
+        # Tile pyramid and previews for zoomable and thumbnail views
+        build_tile_pyramid(output_heatmap_image_path)
+        build_previews(output_heatmap_image_path)
+
         # Check for cancellation after heatmap generation
         if job.get('cancelled'):
             job['status'] = 'cancelled'
@@ -267,16 +400,32 @@ def create_heatmap_job():
         job_results_folder = os.path.join(RESULTS_FOLDER, job_id)
         os.makedirs(job_results_folder, exist_ok=True)
 
-        # Extract first frame as floorplan
-        cap = cv2.VideoCapture(input_video_path)
-        ret, frame = cap.read()
-        cap.release()
-        if not ret:
-            logger.error("Failed to extract first frame from video")
-            return jsonify({"error": "Failed to extract first frame from video"}), 500
-        floorplan_filename = f"floorplan_{job_id}.jpg"
-        input_floorplan_path = os.path.join(job_upload_folder, floorplan_filename)
-        cv2.imwrite(input_floorplan_path, frame)
+        # Use the uploaded floorplan if there is one (detections are then projected onto it
+        # through the pointsData homography), otherwise the first frame
+        floorplan_file = request.files.get('floorplanFile')
+        floorplan_uploaded = bool(floorplan_file and floorplan_file.filename)
+        if floorplan_uploaded:
+            if not allowed_file(floorplan_file.filename, ALLOWED_EXTENSIONS_IMAGE):
+                logger.error("Invalid floorplan file type")
+                return jsonify({"error": "Invalid floorplan file type"}), 400
+            extension = floorplan_file.filename.rsplit('.', 1)[1].lower()
+            floorplan_filename = f"floorplan_{job_id}.{extension}"
+            input_floorplan_path = os.path.join(job_upload_folder, floorplan_filename)
+            floorplan_file.save(input_floorplan_path)
+            if cv2.imread(input_floorplan_path) is None:
+                logger.error("Could not read uploaded floorplan image")
+                return jsonify({"error": "Could not read floorplan image"}), 400
+        else:
+            # Extract first frame as floorplan
+            cap = cv2.VideoCapture(input_video_path)
+            ret, frame = cap.read()
+            cap.release()
+            if not ret:
+                logger.error("Failed to extract first frame from video")
+                return jsonify({"error": "Failed to extract first frame from video"}), 500
+            floorplan_filename = f"floorplan_{job_id}.jpg"
+            input_floorplan_path = os.path.join(job_upload_folder, floorplan_filename)
+            cv2.imwrite(input_floorplan_path, frame)
 
         output_heatmap_image_path = os.path.join(job_results_folder, f"video_{job_id}_heatmap.jpg")
         output_processed_video_path = os.path.join(job_results_folder, f"video_{job_id}.mp4")
@@ -308,6 +457,13 @@ def create_heatmap_job():
         if (end_datetime - start_datetime).total_seconds() <= 0:
             return jsonify({"error": "Time range must be greater than zero."}), 400
 
+        # Optional processing options
+        try:
+            processing_options = parse_processing_options(request.form)
+        except ValueError as e:
+            logger.error(f"Invalid processing options: {e}")
+            return jsonify({"error": f"Invalid processing options: {e}"}), 400
+
         # Save points data (works for both new upload and reuse)
         points_filename = f"points_{job_id}.json"
         input_points_path = os.path.join(job_upload_folder, points_filename)
@@ -330,7 +486,9 @@ def create_heatmap_job():
             'time_range': {
                 'start': start_datetime,
                 'end': end_datetime
-            }
+            },
+            'options': processing_options,
+            'floorplan_uploaded': floorplan_uploaded
         }
 
         # Get current user from JWT
@@ -354,7 +512,10 @@ def create_heatmap_job():
 def get_job_status(job_id):
     job = jobs.get(job_id)
     if job:
-        return jsonify({"job_id": job_id, "status": job['status'], "message": job.get('message', '')})
+        response = {"job_id": job_id, "status": job['status'], "message": job.get('message', '')}
+        if 'processing' in job:
+            response['processing'] = job['processing']
+        return jsonify(response)
     else:
         job_row = get_job(None, None, job_id)
         if job_row:
@@ -376,7 +537,70 @@ def get_heatmap_image(job_id):
             output_image_path = jpg_path
         else:
             return jsonify({"error": "Result image file not found on server"}), 404
-    return send_from_directory(os.path.dirname(output_image_path), os.path.basename(output_image_path))
+    # Optional ?width= serves the smallest preview at least that wide
+    version = image_version(output_image_path)
+    output_image_path = image_for_width(output_image_path, request.args.get('width', type=int))
+    return send_heatmap_file(output_image_path, version)
+
+def send_heatmap_file(path, version):
+    """
+    Send a heatmap image, preview or tile.
+
+    The URLs of custom heatmaps name a time range, not a render, so only
+    requests carrying the current version of the image (?v=, see
+    tiles.image_version) get long-lived cache headers. Other requests are
+    revalidated against the version as ETag, so a re-rendered heatmap is never
+    served stale from a browser or CDN cache.
+    """
+    if request.args.get('v') == version:
+        response = send_from_directory(os.path.dirname(path), os.path.basename(path), max_age=HEATMAP_CACHE_MAX_AGE)
+        response.cache_control.public = True
+        return response
+    response = send_from_directory(os.path.dirname(path), os.path.basename(path), etag=version, max_age=0)
+    response.cache_control.no_cache = True
+    return response
+
+def heatmap_image_path(job_id, job_row, start=None, end=None):
+    """Path of a job's heatmap image, or of its custom heatmap for a time range."""
+    if start is not None and end is not None:
+        return custom_heatmap_path(job_id, start, end)
+    return job_row['output_heatmap_path']
+
+@app.route('/api/heatmap_jobs/<job_id>/tiles/meta', methods=['GET'])
+def get_heatmap_tile_metadata(job_id):
+    """
+    Size, tile size and zoom levels of a heatmap's tile pyramid, and the version of the image
+    (see send_heatmap_file).
+    Optional start/end query arguments select a custom time-range heatmap.
+    """
+    job_row = get_job(None, None, job_id)
+    if not job_row or job_row['status'] != 'completed':
+        return jsonify({"error": "Job not found or not completed"}), 404
+    image_path = heatmap_image_path(
+        job_id, job_row, request.args.get('start', type=float), request.args.get('end', type=float)
+    )
+    if not os.path.exists(image_path):
+        return jsonify({"error": "Heatmap not found"}), 404
+    # Tile URLs carrying the version (?v=) are cached for long
+    return jsonify(dict(build_tile_pyramid(image_path), version=image_version(image_path)))
+
+@app.route('/api/heatmap_jobs/<job_id>/tiles/<int:z>/<int:x>/<int:y>.jpg', methods=['GET'])
+def get_heatmap_tile(job_id, z, x, y):
+    """One TILE_SIZE tile of a heatmap at zoom level z (see tiles.py); start/end select a custom heatmap."""
+    job_row = get_job(None, None, job_id)
+    if not job_row or job_row['status'] != 'completed':
+        return jsonify({"error": "Job not found or not completed"}), 404
+    image_path = heatmap_image_path(
+        job_id, job_row, request.args.get('start', type=float), request.args.get('end', type=float)
+    )
+    if not os.path.exists(image_path):
+        return jsonify({"error": "Heatmap not found"}), 404
+    path = tile_path(image_path, z, x, y)
+    if path is None:
+        return jsonify({"error": "Tile not found"}), 404
+    render_cache.touch(image_path)
+    render_cache.touch(tiles_dir(image_path))
+    return send_heatmap_file(path, image_version(image_path))
 
 @app.route('/api/heatmap_jobs/<job_id>/result/video', methods=['GET'])
 def get_processed_video(job_id):
@@ -384,6 +608,10 @@ def get_processed_video(job_id):
     if not job_row or job_row['status'] != 'completed':
         return jsonify({"error": "Job not found or not completed"}), 404
 
+    processing = load_processing_info(job_id)
+    if processing.get('video_generated') is False:
+        return jsonify({"error": "No annotated video was produced for this job (detect-only mode).", "video_generated": False}), 404
+
     output_video_path = job_row['output_video_path'] if 'output_video_path' in job_row.keys() else None
     if not output_video_path or not os.path.exists(output_video_path):
         return jsonify({"error": "Result video file not found on server"}), 404
@@ -477,30 +705,123 @@ def receive_live_detections(job_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 400
 
-# Helper function to load detections and fps from detections.json
+# Helper function to load a job's detections table and metadata (fps, processing, track IDs)
 
 def load_detections(job_id):
-    detections_path = os.path.join(RESULTS_FOLDER, job_id, 'detections.json')
-    if not os.path.exists(detections_path):
-        logger.error(f"Detections file not found for job ID: {job_id}")
-        return None, None
+    """
+    Load a job's detections table (see detection_store), memory-mapped.
+    Jobs processed before the columnar store are converted from detections.json once.
+
+    Returns:
+        Tuple of (table, metadata dict with 'fps', 'processing' and 'track_ids'),
+        or (None, None) if the job has no detections
+    """
     try:
-        with open(detections_path, 'r') as f:
-            det_data = json.load(f)
-            detections = det_data.get("detections", [])
-            fps = det_data.get("fps")
-        return detections, fps
+        detections, metadata = detection_store.load_detections(os.path.join(RESULTS_FOLDER, job_id))
     except Exception as e:
         logger.error(f"Error reading detections file for job ID {job_id}: {str(e)}")
         return None, None
+    if detections is None:
+        logger.error(f"Detections file not found for job ID: {job_id}")
+    return detections, metadata
+
+def load_processing_info(job_id):
+    """Return the processing metadata of a job (batch size, stride, tracker, video_generated, ...)."""
+    job = jobs.get(job_id)
+    if job and 'processing' in job:
+        return job['processing']
+    _, metadata = load_detections(job_id)
+    return metadata.get("processing", {}) if metadata else {}
+
+def load_heatmap_density(job_id, job_row, heatmap_path, start_time=None, end_time=None):
+    """
+    Load the density grid behind a job's heatmap (or custom range heatmap), memory-mapped.
+
+    Heatmaps rendered before density grids were saved get theirs rebuilt once
+    from the job's detections (or density cube for custom ranges).
+
+    Returns:
+        float16 array of shape (height, width), or None if the heatmap does not exist
+    """
+    path = density_path(heatmap_path)
+    density = load_density(path)
+    if density is not None:
+        return density
+    if not os.path.exists(heatmap_path):
+        return None
+
+    floorplan = load_floorplan(os.path.join(UPLOAD_FOLDER, job_id, job_row['input_floorplan_name']))
+    cube, cube_metadata = load_density_cube(os.path.join(RESULTS_FOLDER, job_id, 'density_cube.npy'))
+    detections, _ = load_detections(job_id)
+    if detections is None:
+        return None
+    if start_time is not None and end_time is not None and cube is not None:
+        heatmap = range_density(cube, cube_metadata, start_time, end_time, detections)
+    else:
+        if start_time is not None and end_time is not None:
+            detections = detection_store.time_slice(detections, start_time, end_time)
+        heatmap = np.zeros(floorplan.shape[:2], dtype=np.float32)
+        accumulate_heatmap(heatmap, detections)
+    logger.info(f"Rebuilding density grid for {heatmap_path}")
+    save_density(spread_density(heatmap), path)
+    return load_density(path)
+
+def load_job_time_series(job_id, detections=None):
+    """
+    Return the cached time series of a job, building and caching it on first use.
+
+    Args:
+        job_id: Job ID
+        detections: The job's detections table if already loaded
+
+    Returns:
+        Time series dict (see time_series.build_time_series), or None if the job has no detections
+    """
+    path = os.path.join(RESULTS_FOLDER, job_id, 'timeseries.json')
+    time_series = load_time_series(path)
+    if time_series is not None:
+        return time_series
+    if detections is None:
+        detections, _ = load_detections(job_id)
+        if detections is None:
+            return None
+    time_series = build_time_series(detections)
+    save_time_series(time_series, path)
+    return time_series
 
 @app.route('/api/heatmap_jobs/<job_id>/detections', methods=['GET'])
 @jwt_required()
 def get_detections_from_json(job_id):
-    detections, fps = load_detections(job_id)
+    """
+    Return a job's detections, optionally only those of a time range
+    (?start_time=&end_time=, seconds) or frame range (?start_frame=&end_frame=).
+    """
+    detections, metadata = load_detections(job_id)
     if detections is None:
         return jsonify({"error": "Detections file not found"}), 404
-    return jsonify({"detections": detections, "fps": fps}), 200
+    start_time = request.args.get('start_time', type=float)
+    end_time = request.args.get('end_time', type=float)
+    start_frame = request.args.get('start_frame', type=int)
+    end_frame = request.args.get('end_frame', type=int)
+    # Frame index offsets refer to the whole table, so slice by frame first
+    if start_frame is not None:
+        frame_index = detection_store.load_frame_index(os.path.join(RESULTS_FOLDER, job_id), metadata)
+        detections = detection_store.frame_slice(detections, frame_index, start_frame, end_frame)
+    if start_time is not None or end_time is not None:
+        detections = detection_store.time_slice(detections, start_time, end_time)
+    return jsonify({
+        "detections": detection_store.to_records(detections, metadata['track_ids']),
+        "fps": metadata.get("fps")
+    }), 200
+
+@app.route('/api/heatmap_jobs/<job_id>/time_series', methods=['GET'])
+@jwt_required()
+def get_time_series(job_id):
+    """Per-bin detection and visitor counts of a job at 1, 5, 15 and 60 minute granularity."""
+    time_series = load_job_time_series(job_id)
+    if time_series is None:
+        return jsonify({"error": "Detections file not found"}), 404
+    return jsonify(time_series), 200
 
 @app.route('/api/heatmap_jobs/<job_id>/export/csv', methods=['GET'])
 @jwt_required()
@@ -520,44 +841,41 @@ def export_heatmap_csv(job_id):
         start_datetime = request.args.get('start_datetime', '')
         end_datetime = request.args.get('end_datetime', '')
         area = request.args.get('area', 'all')
+        block_size = request.args.get('block_size', DEFAULT_REGION_SIZE, type=int)
         start_time = request.args.get('start_time', type=float)
         end_time = request.args.get('end_time', type=float)
 
-        detections, fps = load_detections(job_id)
+        detections, metadata = load_detections(job_id)
         if detections is None:
             logger.error(f"Detections file not found for job {job_id}")
             return jsonify({"error": "Detections file not found"}), 404
+        fps = metadata.get("fps")
         
-        if not detections:
-            logger.warning(f"No detections found in detections.json for job {job_id}")
+        if len(detections) == 0:
+            logger.warning(f"No detections found for job {job_id}")
             return jsonify({"error": "No detections data available"}), 404
 
-        # Filter detections by time range if specified
+        # Slice detections by time range if specified (binary search on the time-sorted table)
         if start_time is not None and end_time is not None:
-            detections = [
-                det for det in detections
-                if 'timestamp' in det and start_time <= det['timestamp'] <= end_time
-            ]
+            detections = detection_store.time_slice(detections, start_time, end_time)
 
         # --- Load analysis data ---
         if start_time is not None and end_time is not None:
             # Use custom heatmap for analysis
-            heatmap_path = os.path.join(
-                RESULTS_FOLDER, job_id, f"custom_heatmap_{float(start_time):.1f}_{float(end_time):.1f}.jpg"
-            )
+            heatmap_path = custom_heatmap_path(job_id, start_time, end_time)
         else:
             heatmap_path = job_row['output_heatmap_path']
 
-        if not os.path.exists(heatmap_path):
+        density = load_heatmap_density(job_id, job_row, heatmap_path, start_time, end_time)
+        if density is None:
             logger.error(f"Heatmap file not found at {heatmap_path}")
             return jsonify({"error": "Heatmap file not found"}), 404
-
-        heatmap = cv2.imread(heatmap_path, cv2.IMREAD_GRAYSCALE)
-        if heatmap is None:
-            logger.error(f"Could not load heatmap from {heatmap_path}")
-            return jsonify({"error": "Could not load heatmap"}), 500
             
-        analysis = analyze_heatmap(heatmap, (1080, 1920), detections=detections, fps=fps)
+        # The cached time series covers the whole video; time ranges are binned from their own detections
+        time_series = load_job_time_series(job_id, detections) if start_time is None or end_time is None else None
+        analysis = analyze_heatmap(
+            density, density.shape, detections=detections, fps=fps, block_size=block_size, time_series=time_series
+        )
 
         output = io.StringIO()
         writer = csv.writer(output)
@@ -588,9 +906,9 @@ def export_heatmap_csv(job_id):
         writer.writerow([])
         writer.writerow(['Peak Hours'])
         if analysis['peak_hours']:
-            writer.writerow(['Start Minute', 'End Minute', 'Detections'])
+            writer.writerow(['Start Minute', 'End Minute', 'Visitors', 'Detections'])
             for ph in analysis['peak_hours']:
-                writer.writerow([ph['start_minute'], ph['end_minute'], ph['count']])
+                writer.writerow([ph['start_minute'], ph['end_minute'], ph['visitors'], ph['detections']])
         else:
             writer.writerow(['No peak hours detected.'])
         writer.writerow([])
@@ -598,7 +916,8 @@ def export_heatmap_csv(job_id):
         # Write detections data
         writer.writerow(['Detections'])
         writer.writerow(['Frame', 'Track ID', 'X1', 'Y1', 'X2', 'Y2', 'Timestamp'])
-        for det in detections:
+        track_ids = metadata['track_ids']
+        for det in detection_store.to_records(detections, track_ids):
             writer.writerow([
                 det['frame'],
                 det['track_id'],
@@ -627,6 +946,7 @@ def export_heatmap_pdf(job_id):
         start_datetime = request.args.get('start_datetime', 'Full video duration')
         end_datetime = request.args.get('end_datetime', 'Full video duration')
         area = request.args.get('area', 'all')
+        block_size = request.args.get('block_size', DEFAULT_REGION_SIZE, type=int)
         start_time = request.args.get('start_time', type=float)
         end_time = request.args.get('end_time', type=float)
 
@@ -640,34 +960,31 @@ def export_heatmap_pdf(job_id):
             return jsonify({'error': 'Job not completed'}), 404
 
         # Load detections
-        detections, fps = load_detections(job_id)
+        detections, metadata = load_detections(job_id)
         if detections is None:
             return jsonify({'error': 'Detections file not found'}), 404
+        fps = metadata.get("fps")
 
-        # Filter detections by time range if specified
+        # Slice detections by time range if specified (binary search on the time-sorted table)
         if start_time is not None and end_time is not None:
-            detections = [
-                det for det in detections
-                if 'timestamp' in det and start_time <= det['timestamp'] <= end_time
-            ]
+            detections = detection_store.time_slice(detections, start_time, end_time)
 
         # Get analysis data
         if start_time is not None and end_time is not None:
             # Use custom heatmap for analysis
-            heatmap_path = os.path.join(
-                RESULTS_FOLDER, job_id, f"custom_heatmap_{float(start_time):.1f}_{float(end_time):.1f}.jpg"
-            )
+            heatmap_path = custom_heatmap_path(job_id, start_time, end_time)
         else:
             heatmap_path = job_row['output_heatmap_path']
 
-        if not os.path.exists(heatmap_path):
+        density = load_heatmap_density(job_id, job_row, heatmap_path, start_time, end_time)
+        if density is None:
             return jsonify({'error': 'Heatmap file not found'}), 404
 
-        heatmap = cv2.imread(heatmap_path, cv2.IMREAD_GRAYSCALE)
-        if heatmap is None:
-            return jsonify({'error': 'Could not load heatmap'}), 500
-
-        analysis = analyze_heatmap(heatmap, (1080, 1920), detections=detections, fps=fps)
+        # The cached time series covers the whole video; time ranges are binned from their own detections
+        time_series = load_job_time_series(job_id, detections) if start_time is None or end_time is None else None
+        analysis = analyze_heatmap(
+            density, density.shape, detections=detections, fps=fps, block_size=block_size, time_series=time_series
+        )
         if not analysis:
             return jsonify({'error': 'Analysis not found'}), 404
 
@@ -728,7 +1045,8 @@ def export_heatmap_pdf(job_id):
         elements.append(Paragraph("Peak Hours:", styles['Heading3']))
         for ph in analysis['peak_hours']:
             elements.append(Paragraph(
-                f"• {ph['start_minute']}-{ph['end_minute']} minutes: {ph['count']} detections",
+                f"• {ph['start_minute']}-{ph['end_minute']} minutes: {ph['visitors']} visitors "
+                f"({ph['detections']} detections)",
                 styles['Normal']
             ))
 
@@ -753,82 +1071,61 @@ def get_heatmap_analysis(job_id):
     if not job_row or job_row['status'] != 'completed':
         return jsonify({"error": "Job not found or not completed"}), 404
 
+    block_size = request.args.get('block_size', DEFAULT_REGION_SIZE, type=int)
     heatmap_path = job_row['output_heatmap_path']
-    if not os.path.exists(heatmap_path):
+    density = load_heatmap_density(job_id, job_row, heatmap_path)
+    if density is None:
         return jsonify({"error": "Heatmap file not found"}), 404
 
-    heatmap = cv2.imread(heatmap_path, cv2.IMREAD_GRAYSCALE)
-    if heatmap is None:
-        return jsonify({"error": "Could not load heatmap"}), 500
-
-    floorplan_filename = job_row['input_floorplan_name']
-    floorplan_path = os.path.join(UPLOAD_FOLDER, job_id, floorplan_filename)
-    floorplan = cv2.imread(floorplan_path)
-    if floorplan is None:
-        return jsonify({"error": "Could not load floorplan"}), 500
-
     # Load detections and fps
-    detections_path = os.path.join(RESULTS_FOLDER, job_id, 'detections.json')
-    if os.path.exists(detections_path):
-        with open(detections_path, 'r') as f:
-            det_data = json.load(f)
-            fps = det_data.get("fps")
-            detections = det_data.get("detections", [])
-    else:
-        fps = None
-        detections = None
+    detections, metadata = load_detections(job_id)
+    fps = metadata.get("fps") if metadata else None
 
-    analysis = analyze_heatmap(heatmap, floorplan.shape[:2], detections=detections, fps=fps)
+    time_series = load_job_time_series(job_id, detections) if detections is not None else None
+    analysis = analyze_heatmap(
+        density, density.shape, detections=detections, fps=fps, block_size=block_size, time_series=time_series
+    )
     return jsonify(analysis)
 
 # Helper function to run custom heatmap generation in a thread
 
-def run_custom_heatmap_job(job_id, start_time, end_time):
-    try:
-        # Fetch job info from DB
-        job_row = get_job(None, None, job_id)
-        if not job_row or job_row['status'] != 'completed':
-            custom_heatmap_progress[job_id] = 1.0
-            return
+def custom_heatmap_path(job_id, start_time, end_time):
+    """Cached custom heatmap image of a time range, for the current render parameters."""
+    return os.path.join(
+        RESULTS_FOLDER, job_id,
+        f"custom_heatmap_{float(start_time):.1f}_{float(end_time):.1f}_{CUSTOM_HEATMAP_RENDER_TAG}.jpg"
+    )
 
-        # Load detections
-        detections_path = os.path.join(RESULTS_FOLDER, job_id, 'detections.json')
-        if not os.path.exists(detections_path):
-            custom_heatmap_progress[job_id] = 1.0
-            return
-        with open(detections_path, 'r') as f:
-            det_data = json.load(f)
-            detections = det_data.get("detections", [])
-            fps = det_data.get("fps")
-
-        # Filter detections by time range
-        filtered_detections = [
-            det for det in detections
-            if 'timestamp' in det and start_time <= det['timestamp'] <= end_time
-        ]
-
-        custom_heatmap_path = os.path.join(
-            RESULTS_FOLDER, job_id, f"custom_heatmap_{float(start_time):.1f}_{float(end_time):.1f}.jpg"
-        )
-        floorplan_path = os.path.join(UPLOAD_FOLDER, job_id, job_row['input_floorplan_name'])
-
-        def progress_callback(progress):
-            custom_heatmap_progress[job_id] = progress
-
-        blend_heatmap(
-            filtered_detections,
-            floorplan_path,
-            custom_heatmap_path,
-            os.path.join(RESULTS_FOLDER, job_id, f"video_{job_id}.mp4"),
-            os.path.join(UPLOAD_FOLDER, job_id, job_row['input_video_name']),
-            progress_callback=progress_callback
-        )
-        if os.path.exists(custom_heatmap_path):
-            upload_to_supabase(job_id, custom_heatmap_path, "jpg")
-        custom_heatmap_progress[job_id] = 1.0
-    except Exception as e:
-        custom_heatmap_progress[job_id] = 1.0
-        logger.error(f"Error in custom heatmap thread: {str(e)}", exc_info=True)
+def custom_heatmap_key(job_id, start_time, end_time):
+    """Render cache key of a custom heatmap request."""
+    return f"{job_id}:{float(start_time):.1f}:{float(end_time):.1f}:{CUSTOM_HEATMAP_RENDER_TAG}"
+
+def run_custom_heatmap_job(job_id, start_time, end_time, progress_callback):
+    # Fetch job info from DB
+    job_row = get_job(None, None, job_id)
+    if not job_row or job_row['status'] != 'completed':
+        raise ValueError("Job not found or not completed")
+    floorplan_path = os.path.join(UPLOAD_FOLDER, job_id, job_row['input_floorplan_name'])
+    floorplan = load_floorplan(floorplan_path)
+
+    # Load the job's density cube, building it once for jobs processed before it existed
+    cube_path = os.path.join(RESULTS_FOLDER, job_id, 'density_cube.npy')
+    cube, cube_metadata = load_density_cube(cube_path)
+    detections, _ = load_detections(job_id)
+    if detections is None:
+        raise ValueError("Detections file not found")
+    if cube is None:
+        progress_callback(0.3)
+        cube, cube_metadata = build_density_cube(detections, floorplan.shape[:2], cube_path)
+    progress_callback(0.5)
+
+    # Heatmap only: the difference of two cube slices for the whole bins in the range,
+    # plus the detections in the partial bins at its ends
+    output_path = custom_heatmap_path(job_id, start_time, end_time)
+    heatmap = range_density(cube, cube_metadata, start_time, end_time, detections)
+    progress_callback(0.6)
+    render_heatmap(heatmap, floorplan, output_path, density_path(output_path))
+    progress_callback(0.8)
 
 @app.route('/api/heatmap_jobs/<job_id>/custom_heatmap', methods=['POST'])
 @jwt_required()
@@ -838,15 +1135,21 @@ def generate_custom_heatmap(job_id):
         start_time = float(data.get('start_time'))
         end_time = float(data.get('end_time'))
         logger.info(f"Custom heatmap request: job_id={job_id}, start_time={start_time}, end_time={end_time}")
-        # Start background thread for custom heatmap generation
-        custom_heatmap_progress[job_id] = 0.0
-        t = threading.Thread(target=run_custom_heatmap_job, args=(job_id, start_time, end_time))
-        t.daemon = True
-        t.start()
+        # Render in the background unless the range is cached or already being rendered
+        key = custom_heatmap_key(job_id, start_time, end_time)
+        output_path = custom_heatmap_path(job_id, start_time, end_time)
+        status = render_cache.submit(
+            key,
+            [output_path, density_path(output_path)],
+            lambda progress_callback: run_custom_heatmap_job(job_id, start_time, end_time, progress_callback),
+            on_done=lambda: upload_to_supabase(job_id, output_path, "jpg")
+        )
+        latest_custom_heatmap[job_id] = key
         # Immediately return success, frontend will poll progress
         return jsonify({
             "success": True,
-            "message": "Custom heatmap generation started. Poll progress endpoint.",
+            "cache": status,
+            "message": "Custom heatmap ready." if status == 'cached' else "Custom heatmap generation started. Poll progress endpoint.",
         })
     except Exception as e:
         logger.error(f"Error generating custom heatmap: {str(e)}", exc_info=True)
@@ -857,16 +1160,35 @@ def generate_custom_heatmap(job_id):
 def get_custom_heatmap_image(job_id):
     start = request.args.get('start')
     end = request.args.get('end')
-    filename = f"custom_heatmap_{float(start):.1f}_{float(end):.1f}.jpg"
-    folder = os.path.join(RESULTS_FOLDER, job_id)
-    if not os.path.exists(os.path.join(folder, filename)):
+    path = custom_heatmap_path(job_id, start, end)
+    if not os.path.exists(path):
         return jsonify({"error": "Custom heatmap not found"}), 404
-    return send_from_directory(folder, filename)
+    render_cache.touch(path)
+    return send_heatmap_file(image_for_width(path, request.args.get('width', type=int)), image_version(path))
 
 @app.route('/api/heatmap_jobs/<job_id>/custom_heatmap_progress')
 def get_custom_heatmap_progress(job_id):
-    progress = custom_heatmap_progress.get(job_id, 0.0)
-    return jsonify({"progress": progress})
+    """
+    Progress of a custom heatmap request, given by its start and end query arguments.
+    Without them, the progress of the job's most recent request is returned.
+    """
+    start = request.args.get('start', type=float)
+    end = request.args.get('end', type=float)
+    if start is not None and end is not None:
+        key = custom_heatmap_key(job_id, start, end)
+    else:
+        key = latest_custom_heatmap.get(job_id)
+    status = render_cache.get_status(key) if key else None
+    if status is None:
+        # The status of a finished request is dropped after a while, its image stays cached
+        if start is not None and end is not None and os.path.exists(custom_heatmap_path(job_id, start, end)):
+            return jsonify({"progress": 1.0, "status": "done"})
+        return jsonify({"progress": 0.0})
+    response = {"progress": status['progress'], "status": status['status']}
+    if 'on_done_error' in status:
+        # The heatmap is ready, only its upload to storage failed
+        response['upload_error'] = status['on_done_error']
+    return jsonify(response)
 
 @app.route('/api/heatmap_jobs/<job_id>/custom_analysis', methods=['GET'])
 @jwt_required()
@@ -876,6 +1198,7 @@ def get_custom_heatmap_analysis(job_id):
         start_time = request.args.get('start_time', type=float)
         end_time = request.args.get('end_time', type=float)
         area = request.args.get('area', 'all')
+        block_size = request.args.get('block_size', DEFAULT_REGION_SIZE, type=int)
 
         # Get job data from database
         job_row = get_job(None, None, job_id)
@@ -887,38 +1210,28 @@ def get_custom_heatmap_analysis(job_id):
             return jsonify({'error': 'Job not completed'}), 404
 
         # Load detections
-        detections_path = os.path.join(RESULTS_FOLDER, job_id, 'detections.json')
-        if not os.path.exists(detections_path):
+        detections, metadata = load_detections(job_id)
+        if detections is None:
             return jsonify({'error': 'Detections file not found'}), 404
+        fps = metadata.get("fps")
 
-        with open(detections_path, 'r') as f:
-            det_data = json.load(f)
-            detections = det_data.get("detections", [])
-            fps = det_data.get("fps")
-
-        # Filter detections by time range
-        filtered_detections = [
-            det for det in detections
-            if 'timestamp' in det and start_time <= det['timestamp'] <= end_time
-        ]
+        # Slice detections by time range (binary search on the time-sorted table)
+        filtered_detections = detection_store.time_slice(detections, start_time, end_time)
 
         # Load the custom heatmap
-        custom_heatmap_path = os.path.join(
-            RESULTS_FOLDER, job_id, f"custom_heatmap_{float(start_time):.1f}_{float(end_time):.1f}.jpg"
+        density = load_heatmap_density(
+            job_id, job_row, custom_heatmap_path(job_id, start_time, end_time), start_time, end_time
         )
-        if not os.path.exists(custom_heatmap_path):
+        if density is None:
             return jsonify({'error': 'Custom heatmap not found'}), 404
 
-        # Analyze the custom heatmap
-        heatmap = cv2.imread(custom_heatmap_path, cv2.IMREAD_GRAYSCALE)
-        if heatmap is None:
-            return jsonify({'error': 'Could not load custom heatmap'}), 500
-
+        # Analyze the custom heatmap's density
         analysis = analyze_heatmap(
-            heatmap,
-            (1080, 1920),  # Default dimensions
+            density,
+            density.shape,
             detections=filtered_detections,
-            fps=fps
+            fps=fps,
+            block_size=block_size
         )
 
         return jsonify(analysis)
@@ -0,0 +1,81 @@
+"""
+calibration.py
+Maps camera pixels to floorplan pixels with the homography defined by a job's four calibration points.
+
+The points (pointsData) are picked on the first video frame in the order
+bottom left, bottom right, top right, top left, and correspond to the same
+corners of the floorplan image.
+"""
+
+import os
+import json
+import cv2
+import numpy as np
+
+def points_to_pixels(points_data, frame_shape):
+    """
+    Convert calibration points to video frame pixels.
+
+    Args:
+        points_data: Four points as {'x', 'y'} dicts or [x, y] lists, either
+            normalized to the frame size (0-1, as sent by the frontend) or in pixels
+        frame_shape: (height, width) of the video frame
+
+    Returns:
+        float32 array of shape (4, 2)
+    """
+    points = np.array([
+        [float(p['x']), float(p['y'])] if isinstance(p, dict) else [float(p[0]), float(p[1])]
+        for p in points_data
+    ], dtype=np.float32)
+    if points.shape != (4, 2):
+        raise ValueError("pointsData must be a list of 4 points")
+    if points.max() <= 1.0:
+        points *= np.array([frame_shape[1], frame_shape[0]], dtype=np.float32)
+    return points
+
+def compute_homography(points_data, frame_shape, floorplan_shape):
+    """
+    Homography mapping the calibration quad in the video frame onto the whole floorplan.
+
+    Returns:
+        3x3 float64 array
+    """
+    height, width = floorplan_shape[:2]
+    # Floorplan corners in pointsData order: bottom left, bottom right, top right, top left
+    corners = np.array([[0, height - 1], [width - 1, height - 1], [width - 1, 0], [0, 0]], dtype=np.float32)
+    return cv2.getPerspectiveTransform(points_to_pixels(points_data, frame_shape), corners)
+
+def load_or_compute_homography(cache_path, points_data, frame_shape, floorplan_shape):
+    """Return the job's homography, computing and caching it in cache_path (JSON) on first use."""
+    if os.path.exists(cache_path):
+        with open(cache_path, 'r') as f:
+            return np.array(json.load(f)['homography'], dtype=np.float64)
+    homography = compute_homography(points_data, frame_shape, floorplan_shape)
+    with open(cache_path, 'w') as f:
+        json.dump({
+            'homography': homography.tolist(),
+            'frame_shape': list(frame_shape[:2]),
+            'floorplan_shape': list(floorplan_shape[:2])
+        }, f)
+    return homography
+
+def project_detections(detections, homography):
+    """
+    Project the foot point (bottom center of the box) of every detection onto the floorplan.
+
+    All points go through a single cv2.perspectiveTransform call. The result is
+    stored in place as detection['floor_point'] = [x, y] (floorplan pixels), which
+    the heatmap uses instead of the box center.
+
+    Returns:
+        The same list of detections
+    """
+    if not detections:
+        return detections
+    boxes = np.array([det['bbox'] for det in detections], dtype=np.float32)
+    feet = np.stack([(boxes[:, 0] + boxes[:, 2]) / 2, boxes[:, 3]], axis=1)
+    projected = cv2.perspectiveTransform(feet[None], homography)[0]
+    for det, point in zip(detections, np.round(projected, 1).tolist()):
+        det['floor_point'] = point
+    return detections
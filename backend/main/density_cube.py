@@ -0,0 +1,174 @@
+"""
+density_cube.py
+Per-job cumulative density cube for heatmaps over arbitrary time ranges.
+
+The cube holds, for every time bin boundary, the number of detection centers
+seen so far in each cell of a coarse grid over the floorplan:
+    cube[b] = counts of all detections with timestamp < b * bin_seconds
+so the density of any range of whole bins is cube[end_bin] - cube[start_bin];
+the partial bins at the ends of other ranges are counted from the detections
+(see range_density), so the bin length only affects how many detections are
+counted directly. Long videos get longer bins so the cube never has more than
+DENSITY_MAX_BINS of them. It is saved as a .npy file (memory-mapped on read)
+with a JSON sidecar holding the grid geometry.
+"""
+
+import os
+import json
+import math
+import threading
+import numpy as np
+from numpy.lib.format import open_memmap
+
+from .heatmap_maker import detection_centers
+
+# Shortest time bin in seconds; longer videos use a multiple of it (see cube_bin_seconds)
+DENSITY_BIN_SECONDS = float(os.getenv('DENSITY_BIN_SECONDS', '5'))
+# Largest number of time bins in a cube
+DENSITY_MAX_BINS = int(os.getenv('DENSITY_MAX_BINS', '1024'))
+# Side of one grid cell in floorplan pixels
+DENSITY_CELL_SIZE = int(os.getenv('DENSITY_CELL_SIZE', '16'))
+
+def cube_bin_seconds(duration, bin_seconds=DENSITY_BIN_SECONDS, max_bins=DENSITY_MAX_BINS):
+    """Smallest multiple of bin_seconds that covers `duration` seconds in at most max_bins bins."""
+    bins = int(duration // bin_seconds) + 1
+    return bin_seconds * max(1, math.ceil(bins / max(1, max_bins)))
+
+def build_density_cube(detections, shape, cube_path, bin_seconds=DENSITY_BIN_SECONDS, cell_size=DENSITY_CELL_SIZE,
+                       max_bins=DENSITY_MAX_BINS):
+    """
+    Build the cumulative density cube of a job's detections and save it to cube_path.
+
+    The cube is written bin by bin into a memory-mapped file, so building it
+    never holds more than one bin of counts in memory.
+
+    Args:
+        detections: List of detections with 'bbox' and 'timestamp', or a detections table
+        shape: (height, width) of the floorplan the detections are drawn on
+        cube_path: .npy file the cube is saved to (its metadata is saved next to it)
+        bin_seconds: Shortest length of one time bin in seconds
+        cell_size: Side of one grid cell in pixels
+        max_bins: Largest number of time bins (longer videos get longer bins)
+
+    Returns:
+        Tuple of (memory-mapped uint32 array of shape (num_bins + 1, grid_height, grid_width), metadata dict)
+    """
+    height, width = shape[:2]
+    grid_height = math.ceil(height / cell_size)
+    grid_width = math.ceil(width / cell_size)
+    if isinstance(detections, np.ndarray):
+        detections = detections[~np.isnan(detections['timestamp'])]
+        timestamps = np.asarray(detections['timestamp'], dtype=np.float64)
+    else:
+        detections = [det for det in detections if 'timestamp' in det]
+        timestamps = np.array([det['timestamp'] for det in detections], dtype=np.float64)
+    bin_seconds = cube_bin_seconds(timestamps.max() if len(timestamps) else 0.0, bin_seconds, max_bins)
+    num_bins = int(timestamps.max() // bin_seconds) + 1 if len(timestamps) else 1
+
+    centers = detection_centers(detections)
+    inside = (
+        (centers[:, 0] >= 0) & (centers[:, 0] < width) &
+        (centers[:, 1] >= 0) & (centers[:, 1] < height)
+    )
+    bins = (timestamps[inside] // bin_seconds).astype(np.int64)
+    cells = centers[inside] // cell_size
+    flat = cells[:, 1] * grid_width + cells[:, 0]
+    # Detections tables are sorted by time already
+    order = np.argsort(bins, kind='stable')
+    bins, flat = bins[order], flat[order]
+    bin_starts = np.searchsorted(bins, np.arange(num_bins + 1), side='left')
+
+    # Accumulate over time one bin at a time
+    tmp_path = f"{os.path.splitext(cube_path)[0]}.{threading.get_ident()}.tmp.npy"
+    cube = open_memmap(tmp_path, mode='w+', dtype=np.uint32, shape=(num_bins + 1, grid_height, grid_width))
+    running = np.zeros(grid_height * grid_width, dtype=np.uint32)
+    cube[0] = 0
+    for b in range(num_bins):
+        running += np.bincount(
+            flat[bin_starts[b]:bin_starts[b + 1]], minlength=grid_height * grid_width
+        ).astype(np.uint32)
+        cube[b + 1] = running.reshape(grid_height, grid_width)
+    cube.flush()
+    del cube
+    os.replace(tmp_path, cube_path)
+
+    metadata = {
+        'bin_seconds': bin_seconds,
+        'cell_size': cell_size,
+        'height': height,
+        'width': width,
+        'num_bins': num_bins
+    }
+    # The cube only counts as saved once its metadata exists
+    with open(_metadata_path(cube_path), 'w') as f:
+        json.dump(metadata, f)
+    return np.load(cube_path, mmap_mode='r'), metadata
+
+def _metadata_path(cube_path):
+    return os.path.splitext(cube_path)[0] + '.json'
+
+def load_density_cube(cube_path):
+    """
+    Load a saved density cube memory-mapped, so only the slices used are read.
+
+    Returns:
+        Tuple of (cube, metadata), or (None, None) if the job has no cube
+    """
+    if not os.path.exists(cube_path) or not os.path.exists(_metadata_path(cube_path)):
+        return None, None
+    with open(_metadata_path(cube_path), 'r') as f:
+        metadata = json.load(f)
+    return np.load(cube_path, mmap_mode='r'), metadata
+
+def range_density(cube, metadata, start_time, end_time, detections=None):
+    """
+    Density of the detections between start_time and end_time (seconds, inclusive).
+
+    The whole bins inside the range come from the cube. With `detections` (the
+    job's time-sorted detections table, see detection_store) the partial bins
+    at both ends are counted exactly from the detections in them; without it
+    the range is widened to whole bins. The cell counts are placed at the cell
+    centers of a full-size canvas, so the result can be passed to
+    heatmap_maker.render_heatmap like an accumulated heatmap.
+
+    Returns:
+        float32 array of shape (height, width)
+    """
+    bin_seconds = metadata['bin_seconds']
+    cell_size = metadata['cell_size']
+    height, width = metadata['height'], metadata['width']
+    last = cube.shape[0] - 1
+    if detections is None:
+        start_bin = min(max(int(start_time // bin_seconds), 0), last)
+        end_bin = min(max(int(math.ceil(end_time / bin_seconds)), start_bin), last)
+    else:
+        # Only the bins entirely inside the range
+        start_bin = min(max(int(math.ceil(start_time / bin_seconds)), 0), last)
+        end_bin = min(max(int(end_time // bin_seconds), start_bin), last)
+    counts = cube[end_bin].astype(np.float32) - cube[start_bin]
+
+    if detections is not None:
+        # Edge detections: start_time <= t < start of the first whole bin, and
+        # end of the last whole bin <= t <= end_time (the whole range if there is no whole bin)
+        timestamps = detections['timestamp']
+        first = np.searchsorted(timestamps, start_time, side='left')
+        stop = np.searchsorted(timestamps, end_time, side='right')
+        if start_bin < end_bin:
+            inner_start = max(first, np.searchsorted(timestamps, start_bin * bin_seconds, side='left'))
+            inner_stop = min(stop, np.searchsorted(timestamps, end_bin * bin_seconds, side='left'))
+            edges = np.concatenate([detections[first:inner_start], detections[inner_stop:stop]])
+        else:
+            edges = detections[first:stop]
+        centers = detection_centers(edges)
+        inside = (
+            (centers[:, 0] >= 0) & (centers[:, 0] < width) &
+            (centers[:, 1] >= 0) & (centers[:, 1] < height)
+        )
+        cells = centers[inside] // cell_size
+        np.add.at(counts, (cells[:, 1], cells[:, 0]), 1.0)
+
+    canvas = np.zeros((height, width), dtype=np.float32)
+    rows = np.minimum(np.arange(counts.shape[0]) * cell_size + cell_size // 2, height - 1)
+    cols = np.minimum(np.arange(counts.shape[1]) * cell_size + cell_size // 2, width - 1)
+    canvas[np.ix_(rows, cols)] = counts
+    return canvas
@@ -0,0 +1,220 @@
+"""
+detection_store.py
+Columnar on-disk store of a job's detections, memory-mapped on read.
+
+A job's detections are saved as one structured NumPy array (detections.npy),
+one row per detection, sorted by timestamp:
+    frame, track_id, x1, y1, x2, y2, timestamp, floor_x, floor_y
+track_id is the index of the track's ID in the 'track_ids' list of the JSON
+sidecar (detections_meta.json), which also holds the fps and processing stats.
+floor_x/floor_y are NaN for detections not projected onto a floorplan, and
+timestamp is NaN for detections without one. Jobs processed before the store
+existed (detections.json) are converted on first read.
+
+Because the rows are sorted, the timestamp column is the job's time index:
+time ranges are found by binary search and returned as contiguous views of
+the memory-mapped table (see time_slice). The frame index
+(detections_frames.npy) holds the first row of every frame (see frame_slice).
+"""
+
+import os
+import json
+import logging
+import threading
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DETECTIONS_FILE = 'detections.npy'
+DETECTIONS_METADATA_FILE = 'detections_meta.json'
+FRAME_INDEX_FILE = 'detections_frames.npy'
+LEGACY_DETECTIONS_FILE = 'detections.json'
+
+DETECTION_DTYPE = np.dtype([
+    ('frame', '<i4'),
+    ('track_id', '<i4'),
+    ('x1', '<i4'),
+    ('y1', '<i4'),
+    ('x2', '<i4'),
+    ('y2', '<i4'),
+    ('timestamp', '<f8'),
+    ('floor_x', '<f4'),
+    ('floor_y', '<f4')
+])
+
+_convert_lock = threading.Lock()
+
+def to_table(detections):
+    """
+    Convert a list of detection dicts to the columnar format.
+
+    Args:
+        detections: List of dicts with 'frame', 'track_id', 'bbox' and optionally
+            'timestamp' and 'floor_point'
+
+    Returns:
+        Tuple of (structured array sorted by timestamp, list of track IDs indexed by its track_id column)
+    """
+    count = len(detections)
+    table = np.empty(count, dtype=DETECTION_DTYPE)
+    table['frame'] = np.fromiter((det.get('frame', -1) for det in detections), dtype=np.int32, count=count)
+    # Number the distinct track IDs 0..num_tracks-1
+    id_numbers = {}
+    table['track_id'] = np.fromiter(
+        (id_numbers.setdefault(det.get('track_id'), len(id_numbers)) for det in detections),
+        dtype=np.int32, count=count
+    )
+    boxes = np.array([det['bbox'] for det in detections], dtype=np.int32).reshape(count, 4)
+    for column, name in enumerate(('x1', 'y1', 'x2', 'y2')):
+        table[name] = boxes[:, column]
+    table['timestamp'] = np.fromiter(
+        (det.get('timestamp', np.nan) for det in detections), dtype=np.float64, count=count
+    )
+    floor_points = np.array(
+        [det.get('floor_point', (np.nan, np.nan)) for det in detections], dtype=np.float32
+    ).reshape(count, 2)
+    table['floor_x'] = floor_points[:, 0]
+    table['floor_y'] = floor_points[:, 1]
+
+    # Stable sort keeps the frame order of detections with equal timestamps
+    table = table[np.argsort(table['timestamp'], kind='stable')]
+    return table, list(id_numbers)
+
+def to_records(table, track_ids):
+    """Convert (a slice of) a detections table back to the list of dicts format of detections.json."""
+    columns = {name: table[name].tolist() for name in DETECTION_DTYPE.names}
+    records = []
+    for i in range(len(table)):
+        record = {
+            'frame': columns['frame'][i],
+            'bbox': [columns['x1'][i], columns['y1'][i], columns['x2'][i], columns['y2'][i]],
+            'track_id': track_ids[columns['track_id'][i]]
+        }
+        if not np.isnan(columns['timestamp'][i]):
+            record['timestamp'] = columns['timestamp'][i]
+        if not np.isnan(columns['floor_x'][i]):
+            record['floor_point'] = [round(columns['floor_x'][i], 1), round(columns['floor_y'][i], 1)]
+        records.append(record)
+    return records
+
+def build_frame_index(table):
+    """
+    Row offsets of every frame in a detections table: the detections of frame f
+    are table[offsets[f]:offsets[f + 1]].
+
+    Returns:
+        int64 array of length last_frame + 2, or None if the rows are not in frame order
+    """
+    frames = table['frame']
+    if not len(frames):
+        return np.zeros(1, dtype=np.int64)
+    if frames[0] < 0 or np.any(frames[1:] < frames[:-1]):
+        return None
+    return np.searchsorted(frames, np.arange(int(frames[-1]) + 2), side='left').astype(np.int64)
+
+def _save_frame_index(job_dir, table):
+    """Save the frame index of a table, returning whether it has one."""
+    frame_index = build_frame_index(table)
+    if frame_index is None:
+        logger.warning(f"Detections of {job_dir} are not in frame order, frame queries will scan the table")
+        return False
+    np.save(os.path.join(job_dir, FRAME_INDEX_FILE), frame_index)
+    return True
+
+def save_detections(job_dir, table, track_ids, fps, processing=None):
+    """
+    Save a detections table, its frame index and its metadata in a job's results folder.
+
+    Returns:
+        Tuple of (table path, metadata path)
+    """
+    table_path = os.path.join(job_dir, DETECTIONS_FILE)
+    metadata_path = os.path.join(job_dir, DETECTIONS_METADATA_FILE)
+    # Write the table first: a job only counts as converted once its metadata exists
+    with open(table_path + '.tmp', 'wb') as f:
+        np.save(f, table)
+    os.replace(table_path + '.tmp', table_path)
+    frame_indexed = _save_frame_index(job_dir, table)
+    with open(metadata_path + '.tmp', 'w') as f:
+        json.dump({
+            'fps': fps,
+            'processing': processing or {},
+            'count': len(table),
+            'track_ids': track_ids,
+            'frame_indexed': frame_indexed
+        }, f)
+    os.replace(metadata_path + '.tmp', metadata_path)
+    return table_path, metadata_path
+
+def _convert_legacy_detections(job_dir):
+    """Convert a job's detections.json to the columnar store, once."""
+    with open(os.path.join(job_dir, LEGACY_DETECTIONS_FILE), 'r') as f:
+        det_data = json.load(f)
+    table, track_ids = to_table(det_data.get('detections', []))
+    save_detections(job_dir, table, track_ids, det_data.get('fps'), det_data.get('processing'))
+    logger.info(f"Converted {LEGACY_DETECTIONS_FILE} of {job_dir} to {DETECTIONS_FILE}")
+
+def load_detections(job_dir):
+    """
+    Load a job's detections table memory-mapped, so only the rows and columns used are read.
+
+    Returns:
+        Tuple of (structured array, metadata dict with 'fps', 'processing' and
+        'track_ids'), or (None, None) if the job has no detections
+    """
+    table_path = os.path.join(job_dir, DETECTIONS_FILE)
+    metadata_path = os.path.join(job_dir, DETECTIONS_METADATA_FILE)
+    if not os.path.exists(metadata_path):
+        if not os.path.exists(os.path.join(job_dir, LEGACY_DETECTIONS_FILE)):
+            return None, None
+        with _convert_lock:
+            if not os.path.exists(metadata_path):
+                _convert_legacy_detections(job_dir)
+    with open(metadata_path, 'r') as f:
+        metadata = json.load(f)
+    # Empty files cannot be memory-mapped
+    table = np.load(table_path, mmap_mode='r' if metadata['count'] else None)
+    return table, metadata
+
+def load_frame_index(job_dir, metadata):
+    """
+    Load the frame index of a job's detections (see build_frame_index), memory-mapped.
+
+    Returns:
+        The offsets array, or None if the job's detections are not in frame order
+    """
+    if not metadata.get('frame_indexed'):
+        return None
+    return np.load(os.path.join(job_dir, FRAME_INDEX_FILE), mmap_mode='r')
+
+def time_slice(table, start_time=None, end_time=None):
+    """
+    Detections with start_time <= timestamp <= end_time (seconds), in O(log n).
+
+    Either bound may be None for an open range. Detections without a
+    timestamp are never included.
+
+    Returns:
+        A view of the table (no rows are copied)
+    """
+    timestamps = table['timestamp']
+    start = 0 if start_time is None else np.searchsorted(timestamps, start_time, side='left')
+    # NaN timestamps sort last, so an open end stops before them
+    end = np.searchsorted(timestamps, np.inf if end_time is None else end_time, side='right')
+    return table[start:end]
+
+def frame_slice(table, frame_index, start_frame, end_frame=None):
+    """
+    Detections of frames start_frame to end_frame (inclusive; just start_frame if end_frame is None).
+
+    Returns:
+        A view of the table when a frame index is given, otherwise a copy of the matching rows
+    """
+    end_frame = start_frame if end_frame is None else end_frame
+    if frame_index is None:
+        frames = table['frame']
+        return table[(frames >= start_frame) & (frames <= end_frame)]
+    last = len(frame_index) - 1
+    start = frame_index[min(max(start_frame, 0), last)]
+    end = frame_index[min(max(end_frame + 1, 0), last)]
+    return table[start:end]
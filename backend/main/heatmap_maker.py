@@ -3,184 +3,259 @@ heatmap_maker.py
 Handles heatmap generation and blending logic for the backend.
 """
 
+import os
 import cv2
+import threading
 import numpy as np
-from scipy.ndimage import gaussian_filter
+from .video_overlay import generate_video_overlay
+from .time_series import build_time_series, peak_bins
 
 # Add this after your imports
 custom_heatmap_progress = {}
 
-def analyze_peak_hours(detections, fps, bin_minutes=5):
+# Radius (pixels) of the disk each detection adds to the heatmap
+SPLAT_RADIUS = 20
+_SPLAT_KERNEL = cv2.getStructuringElement(
+    cv2.MORPH_ELLIPSE, (2 * SPLAT_RADIUS + 1, 2 * SPLAT_RADIUS + 1)
+).astype(np.float32)
+# Detections converted to arrays (and reported as progress) at a time
+SPLAT_CHUNK_SIZE = 100000
+
+# Blur applied to the rendered heatmap (sigma in floorplan pixels) and the number of
+# pyramid levels (halvings) it runs below full resolution
+RENDER_BLUR_SIGMA = 10
+RENDER_PYRAMID_LEVELS = 2
+
+# Default side (in pixels) of the regions analyze_heatmap classifies
+DEFAULT_REGION_SIZE = 50
+# Largest difference between a float64 block mean and np.mean of the float32 block
+MEAN_TOLERANCE = 1e-3
+
+def load_floorplan(floorplan_path):
+    """Load the floorplan image, raising ValueError if it cannot be read."""
+    floorplan = cv2.imread(floorplan_path)
+    if floorplan is None:
+        raise ValueError(f"Could not load floorplan image: {floorplan_path}")
+    return floorplan
+
+def detection_centers(detections):
+    """
+    Integer (x, y) heatmap positions of detections, as an (N, 2) array.
+
+    Detections projected onto a floorplan (see calibration.project_detections)
+    use their 'floor_point', others the center of their bounding box.
+
+    Args:
+        detections: List of detection dicts or a detections table (see detection_store)
+    """
+    if isinstance(detections, np.ndarray):
+        boxes = np.stack([detections[name] for name in ('x1', 'y1', 'x2', 'y2')], axis=1).astype(np.float32)
+        centers = (boxes[:, :2] + boxes[:, 2:]) / 2
+        floor_points = np.stack([detections['floor_x'], detections['floor_y']], axis=1)
+        projected = ~np.isnan(floor_points[:, 0])
+        centers[projected] = np.floor(floor_points[projected])
+        return centers.astype(np.int64)
+    if not detections:
+        return np.zeros((0, 2), dtype=np.int64)
+    if 'floor_point' in detections[0]:
+        points = np.array([detection['floor_point'] for detection in detections], dtype=np.float32)
+        return np.floor(points).astype(np.int64)
+    boxes = np.array([detection['bbox'] for detection in detections], dtype=np.float32)
+    return ((boxes[:, :2] + boxes[:, 2:]) / 2).astype(np.int64)
+
+def accumulate_heatmap(heatmap, detections, progress_callback=None):
+    """
+    Add detections to a heatmap canvas in place.
+
+    The canvas counts detection centers per pixel; render_heatmap spreads the
+    counts with the splat kernel. Can be called once with all detections or
+    incrementally (e.g. once per frame).
+    
+    Args:
+        heatmap: float32 canvas with the floorplan's height and width
+        detections: List of detections with a 'bbox', or a detections table
+        progress_callback: Optional callback function(progress) to report progress
     """
-    Analyze detections to find peak time frames.
-    - detections: list of dicts, each with a 'timestamp' (in seconds)
-    - fps: frames per second of the video
-    - bin_minutes: size of each time bin in minutes
-    Returns: list of (start_time, end_time, count) for the busiest bins
+    total_detections = len(detections)
+    height, width = heatmap.shape[:2]
+    for start in range(0, total_detections, SPLAT_CHUNK_SIZE):
+        centers = detection_centers(detections[start:start + SPLAT_CHUNK_SIZE])
+        inside = (
+            (centers[:, 0] >= 0) & (centers[:, 0] < width) &
+            (centers[:, 1] >= 0) & (centers[:, 1] < height)
+        )
+        centers = centers[inside]
+        # Unbuffered add so repeated centers are all counted
+        np.add.at(heatmap, (centers[:, 1], centers[:, 0]), 1.0)
+        
+        if progress_callback:
+            progress_callback(min(1.0, (start + SPLAT_CHUNK_SIZE) / total_detections))
+    return heatmap
+
+def spread_density(heatmap):
+    """Spread the center counts of an accumulated canvas over disks of SPLAT_RADIUS (one convolution)."""
+    density = cv2.filter2D(heatmap, -1, _SPLAT_KERNEL, borderType=cv2.BORDER_CONSTANT)
+    return np.maximum(density, 0, out=density)
+
+def density_path(heatmap_image_path):
+    """Location of the density grid saved next to a heatmap image."""
+    return os.path.splitext(heatmap_image_path)[0] + '_density.npy'
+
+def save_density(density, path):
+    """Save a density grid as float16, scaled so its peak is 1."""
+    peak = float(density.max())
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.save(f, (density / peak if peak > 0 else density).astype(np.float16))
+    os.replace(tmp_path, path)
+
+def load_density(path):
+    """Load a saved density grid memory-mapped, or return None if it does not exist."""
+    if not os.path.exists(path):
+        return None
+    return np.load(path, mmap_mode='r')
+
+def render_heatmap(heatmap, floorplan, output_heatmap_path, output_density_path=None):
+    """
+    Colorize an accumulated heatmap canvas, blend it over the floorplan and save it.
+    
+    Args:
+        heatmap: Canvas filled by accumulate_heatmap
+        floorplan: Floorplan image (BGR array)
+        output_heatmap_path: Path to save the heatmap image
+        output_density_path: Optional path to save the density grid for analysis (see save_density)
+        
+    Returns:
+        The blended image
     """
-    # Gather all timestamps
-    timestamps = [det['timestamp'] for det in detections if 'timestamp' in det]
-    if not timestamps:
-        return []
+    # Spread every detection center over a disk in one convolution
+    heatmap = spread_density(heatmap)
+    if output_density_path:
+        save_density(heatmap, output_density_path)
 
-    # Bin timestamps into intervals
-    bin_seconds = bin_minutes * 60
-    max_time = max(timestamps)
-    num_bins = int(np.ceil(max_time / bin_seconds))
-    bins = [0] * (num_bins + 1)
+    # Apply gamma correction to brighten low values and normalize to 0-1, in place
+    cv2.pow(heatmap, 0.6, dst=heatmap)
+    cv2.normalize(heatmap, heatmap, 0, 1, cv2.NORM_MINMAX)
 
-    for t in timestamps:
-        bin_idx = int(t // bin_seconds)
-        bins[bin_idx] += 1
+    # Gaussian blur at reduced resolution: each pyramid level halves the image,
+    # the blur runs on the small image and the result is upsampled once
+    blurred = heatmap
+    for _ in range(RENDER_PYRAMID_LEVELS):
+        blurred = cv2.pyrDown(blurred)
+    scale = 2 ** RENDER_PYRAMID_LEVELS
+    blurred = cv2.GaussianBlur(blurred, (0, 0), RENDER_BLUR_SIGMA / scale)
+    blurred = cv2.resize(blurred, (heatmap.shape[1], heatmap.shape[0]), interpolation=cv2.INTER_LINEAR)
 
-    # Find the bin(s) with the most detections
-    peak_count = max(bins)
-    peak_bins = [i for i, count in enumerate(bins) if count == peak_count]
+    # Convert to color heatmap (blue-green-yellow-red)
+    heatmap_img = cv2.convertScaleAbs(blurred, alpha=255)
+    heatmap_colored = cv2.applyColorMap(heatmap_img, cv2.COLORMAP_TURBO)
 
-    # Format results as readable time ranges
-    results = []
-    for bin_idx in peak_bins:
-        start = bin_idx * bin_minutes
-        end = (bin_idx + 1) * bin_minutes
-        results.append({
-            "start_minute": start,
-            "end_minute": end,
-            "count": peak_count
-        })
-    return results
+    # Per-pixel alpha blending: alpha is higher for high-traffic, lower for low-traffic,
+    # scaled to max 0.7 for more transparency. Weights are float32, images stay uint8
+    alpha_mask = heatmap
+    alpha_mask *= 0.7
+    floorplan_weight = np.subtract(1.0, alpha_mask, out=blurred)
+    blended = cv2.blendLinear(heatmap_colored, floorplan, alpha_mask, floorplan_weight)
+    
+    # Save heatmap image next to its final path and move it into place, so it is never served half-written
+    tmp_path = f"{output_heatmap_path}.{threading.get_ident()}.tmp{os.path.splitext(output_heatmap_path)[1]}"
+    cv2.imwrite(tmp_path, blended)
+    os.replace(tmp_path, output_heatmap_path)
+    return blended
 
-def blend_heatmap(detections, floorplan_path, output_heatmap_path, output_video_path, video_path, progress_callback=None):
+def blend_heatmap(detections, floorplan_path, output_heatmap_path, output_video_path=None, video_path=None, progress_callback=None):
     """
     Generate and blend heatmap from detections.
+
+    Jobs build their heatmap while tracking (see detect_and_track's heatmap
+    argument) and only call render_heatmap; this function is for rendering
+    from stored detections, optionally re-rendering the annotated video too.
     
     Args:
         detections: List of detections from object tracking
         floorplan_path: Path to floorplan image
         output_heatmap_path: Path to save the heatmap image
-        output_video_path: Path to save the processed video
+        output_video_path: Path to save the processed video, or None to only build the heatmap
         video_path: Path to the video
         progress_callback: Optional callback function(progress) to report progress
     """
-    # Load floorplan
-    floorplan = cv2.imread(floorplan_path)
-    if floorplan is None:
-        raise ValueError(f"Could not load floorplan image: {floorplan_path}")
+    floorplan = load_floorplan(floorplan_path)
     
     # Create heatmap canvas
     heatmap = np.zeros(floorplan.shape[:2], dtype=np.float32)
     
     # Process detections (Phase 1: 0%–50%)
-    total_detections = len(detections)
-    for i, detection in enumerate(detections):
-        # Get bounding box center
-        bbox = detection['bbox']
-        center_x = int((bbox[0] + bbox[2]) / 2)
-        center_y = int((bbox[1] + bbox[3]) / 2)
-        
-        # Add Gaussian kernel at detection point
-        cv2.circle(heatmap, (center_x, center_y), 20, 1.0, -1)
-        
-        # Update progress (0%–50%)
-        if progress_callback and total_detections > 0:
-            progress = 0.5 * (i + 1) / total_detections
-            progress_callback(progress)
+    accumulate_heatmap(
+        heatmap,
+        detections,
+        progress_callback=progress_callback and (lambda p: progress_callback(0.5 * p))
+    )
+    render_heatmap(heatmap, floorplan, output_heatmap_path, density_path(output_heatmap_path))
+
+    if not output_video_path:
+        if progress_callback:
+            progress_callback(1.0)
+        return
     
-    # Apply gamma correction to brighten low values
-    heatmap = np.power(heatmap, 0.6)
-    heatmap_norm = cv2.normalize(heatmap, None, 0, 1, cv2.NORM_MINMAX)  # For alpha mask
-    heatmap_img = cv2.normalize(heatmap, None, 0, 255, cv2.NORM_MINMAX)
+    # Re-render the video with detections (Phase 2: 50%–100%)
+    generate_video_overlay(
+        detections,
+        video_path,
+        output_video_path,
+        progress_callback=progress_callback and (lambda p: progress_callback(0.5 + 0.5 * p))
+    )
 
-    # Apply Gaussian blur
-    heatmap_img = gaussian_filter(heatmap_img, sigma=10)
+def _block_means(values, block_size, thresholds=()):
+    """
+    Mean of every block_size x block_size block of a 2D array (edge blocks may be smaller).
 
-    # Convert to color heatmap (blue-green-yellow-red)
-    heatmap_colored = cv2.applyColorMap(heatmap_img.astype(np.uint8), cv2.COLORMAP_TURBO)
+    The means are summed in float64, while np.mean of a float32 block sums in
+    float32. Blocks whose mean is within MEAN_TOLERANCE of one of the thresholds
+    or of a rounding boundary of round(mean, 1) are recomputed with np.mean, so
+    classifying and rounding the means gives the same result as a per-region loop.
 
-    # Per-pixel alpha blending: alpha is higher for high-traffic, lower for low-traffic
-    alpha_mask = heatmap_norm[..., None]  # Shape (H, W, 1)
-    # Optionally, scale alpha to max 0.7 for even more transparency
-    alpha_mask = alpha_mask * 0.7
-    blended = (floorplan * (1 - alpha_mask) + heatmap_colored * alpha_mask).astype(np.uint8)
-    
-    # Save heatmap image
-    cv2.imwrite(output_heatmap_path, blended)
-    
-    # Create video with detections (Phase 2: 50%–100%)
-    cap = cv2.VideoCapture(video_path)
-    if not cap.isOpened():
-        raise ValueError("Could not open video for processing")
-    
-    # Get video properties
-    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    
-    # Create video writer
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-    out = cv2.VideoWriter(output_video_path, fourcc, fps, (width, height))
-    
-    # Process video frames
-    frame_detections = {}
-    for detection in detections:
-        frame = detection['frame']
-        if frame not in frame_detections:
-            frame_detections[frame] = []
-        frame_detections[frame].append(detection)
-    
-    frame_count = 0
-    while cap.isOpened():
-        ret, frame = cap.read()
-        if not ret:
-            break
-        
-        # Draw detections for current frame
-        if frame_count in frame_detections:
-            for detection in frame_detections[frame_count]:
-                bbox = detection['bbox']
-                track_id = detection['track_id']
-                
-                # Draw bounding box
-                cv2.rectangle(frame, 
-                            (int(bbox[0]), int(bbox[1])), 
-                            (int(bbox[2]), int(bbox[3])), 
-                            (0, 255, 0), 2)
-                
-                # Draw track ID
-                cv2.putText(frame, 
-                           f"ID: {track_id}", 
-                           (int(bbox[0]), int(bbox[1] - 10)), 
-                           cv2.FONT_HERSHEY_SIMPLEX, 
-                           0.5, 
-                           (0, 255, 0), 
-                           2)
-        
-        # Write frame
-        out.write(frame)
-        frame_count += 1
-        # Update progress (50%–100%)
-        if progress_callback and total_frames > 0:
-            progress = 0.5 + 0.5 * (frame_count / total_frames)
-            progress_callback(progress)
-    
-    # Release resources
-    cap.release()
-    out.release()
+    Returns:
+        Tuple of (block means, number of pixels per block), both of shape (rows, cols)
+    """
+    height, width = values.shape
+    row_starts = np.arange(0, height, block_size)
+    col_starts = np.arange(0, width, block_size)
+    sums = np.add.reduceat(
+        np.add.reduceat(values, col_starts, axis=1, dtype=np.float64), row_starts, axis=0
+    )
+    sizes = np.outer(
+        np.minimum(block_size, height - row_starts),
+        np.minimum(block_size, width - col_starts)
+    )
+    means = sums / sizes
+    tenths = means * 10
+    near = np.abs(tenths - np.floor(tenths) - 0.5) < MEAN_TOLERANCE * 10
+    for threshold in thresholds:
+        near |= np.abs(means - threshold) < MEAN_TOLERANCE
+    for row, col in zip(*np.nonzero(near)):
+        y, x = row * block_size, col * block_size
+        means[row, col] = float(np.mean(values[y:y + block_size, x:x + block_size]))
+    return means, sizes
 
-def analyze_heatmap(heatmap, floorplan_shape, detections=None, fps=None):
+def analyze_heatmap(heatmap, floorplan_shape, detections=None, fps=None, block_size=DEFAULT_REGION_SIZE,
+                    time_series=None):
     """
     Analyze heatmap data to identify traffic patterns and generate insights.
     
     Args:
-        heatmap: numpy array of heatmap data
+        heatmap: Density grid of the heatmap (see save_density)
         floorplan_shape: tuple of (height, width) of the floorplan
-        detections: List of detections from object tracking
+        detections: List of detections from object tracking, or a detections table
         fps: Frames per second of the video
+        block_size: Side (in pixels) of the square regions the heatmap is classified in
+        time_series: Cached time series of the detections (see time_series.build_time_series);
+            built from `detections` when not given
         
     Returns:
         dict containing analysis results
     """
     # Normalize heatmap to 0-100 range for percentage calculations
+    heatmap = np.asarray(heatmap, dtype=np.float32)
     heatmap_norm = cv2.normalize(heatmap, None, 0, 100, cv2.NORM_MINMAX)
     
     # Define traffic thresholds
@@ -191,45 +266,26 @@ def analyze_heatmap(heatmap, floorplan_shape, detections=None, fps=None):
     # Calculate total area
     total_area = floorplan_shape[0] * floorplan_shape[1]
     
-    # Initialize areas dictionary
-    areas = {
-        'high': {'pixels': 0, 'regions': []},
-        'medium': {'pixels': 0, 'regions': []},
-        'low': {'pixels': 0, 'regions': []}
-    }
-    
-    # Analyze regions
-    height, width = heatmap_norm.shape
-    region_size = 50  # Size of region to analyze (in pixels)
+    # Average density of every region in one block reduction
+    block_size = max(1, int(block_size))
+    densities, sizes = _block_means(heatmap_norm, block_size, (HIGH_THRESHOLD, MEDIUM_THRESHOLD, LOW_THRESHOLD))
     
-    for y in range(0, height, region_size):
-        for x in range(0, width, region_size):
-            # Get region
-            region = heatmap_norm[y:min(y+region_size, height), x:min(x+region_size, width)]
-            avg_density = np.mean(region)
-            
-            # Categorize region
-            if avg_density >= HIGH_THRESHOLD:
-                areas['high']['pixels'] += region.size
-                areas['high']['regions'].append({
-                    'x': x,
-                    'y': y,
-                    'density': round(avg_density, 1)
-                })
-            elif avg_density >= MEDIUM_THRESHOLD:
-                areas['medium']['pixels'] += region.size
-                areas['medium']['regions'].append({
-                    'x': x,
-                    'y': y,
-                    'density': round(avg_density, 1)
-                })
-            elif avg_density >= LOW_THRESHOLD:
-                areas['low']['pixels'] += region.size
-                areas['low']['regions'].append({
-                    'x': x,
-                    'y': y,
-                    'density': round(avg_density, 1)
-                })
+    # Categorize regions
+    masks = {
+        'high': densities >= HIGH_THRESHOLD,
+        'medium': (densities >= MEDIUM_THRESHOLD) & (densities < HIGH_THRESHOLD),
+        'low': (densities >= LOW_THRESHOLD) & (densities < MEDIUM_THRESHOLD)
+    }
+    areas = {}
+    for category, mask in masks.items():
+        rows, cols = np.nonzero(mask)
+        areas[category] = {
+            'pixels': int(sizes[mask].sum()),
+            'regions': [
+                {'x': int(x), 'y': int(y), 'density': round(float(density), 1)}
+                for x, y, density in zip(cols * block_size, rows * block_size, densities[mask])
+            ]
+        }
     
     # Calculate percentages
     for category in areas:
@@ -246,15 +302,13 @@ def analyze_heatmap(heatmap, floorplan_shape, detections=None, fps=None):
         recommendations.append("Optimize store layout to create more balanced traffic distribution")
     
     # Add peak hours analysis if available
-    if detections and fps:
-        peak_hours = analyze_peak_hours(detections, fps)
+    if time_series is None and detections is not None and len(detections):
+        time_series = build_time_series(detections)
+    if time_series is not None:
+        peak_hours = peak_bins(time_series)
+        total_visitors = time_series['total_visitors']
     else:
         peak_hours = []
-    
-    if detections:
-        unique_ids = set(det['track_id'] for det in detections if 'track_id' in det)
-        total_visitors = len(unique_ids)
-    else:
         total_visitors = 0
     
     return {
@@ -14,6 +14,9 @@ url = os.getenv("SUPABASE_URL")
 key = os.getenv("SUPABASE_KEY")
 supabase: Client = create_client(url, key)
 
+# Content types of the result files uploaded to storage
+UPLOAD_CONTENT_TYPES = {"jpg": "image/jpeg", "json": "application/json", "npy": "application/octet-stream"}
+
 def insert_job(*args, **kwargs):
     logger.debug("Inserting job into Supabase")
     response = supabase.table("jobs").insert(kwargs).execute()
@@ -52,7 +55,7 @@ def get_jobs_for_user(user):
 def upload_to_supabase(job_id, local_file_path, file_type):
     """
     Uploads a file to Supabase Storage under the given job_id folder.
-    file_type: 'jpg' or 'json'
+    file_type: 'jpg', 'json' or 'npy'
     """
     bucket_name = "projectresults"
     file_name = os.path.basename(local_file_path)
@@ -61,7 +64,7 @@ def upload_to_supabase(job_id, local_file_path, file_type):
     with open(local_file_path, "rb") as f:
         data = f.read()
         response = supabase.storage.from_(bucket_name).upload(
-            storage_path, data, {"content-type": "image/jpeg" if file_type == "jpg" else "application/json"}
+            storage_path, data, {"content-type": UPLOAD_CONTENT_TYPES.get(file_type, "application/octet-stream")}
         )
         logger.info(f"Upload response: {response}")
         return response
@@ -0,0 +1,158 @@
+"""
+model_registry.py
+Process-wide cache of loaded YOLO models, shared by every job running in a worker.
+Also exports the PyTorch weights to the configured CPU inference backend (ONNX Runtime
+or OpenVINO) and caches the exported model on disk.
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+import logging
+from collections import OrderedDict
+import numpy as np
+from ultralytics import YOLO
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WEIGHTS = os.getenv('YOLO_WEIGHTS', 'yolov8n.pt')
+DEFAULT_DEVICE = os.getenv('YOLO_DEVICE', 'cpu')
+
+# Inference runtime for this deployment: 'torch', 'onnx' or 'openvino'
+INFERENCE_BACKEND = os.getenv('INFERENCE_BACKEND', 'torch')
+INFERENCE_BACKENDS = ('torch', 'onnx', 'openvino')
+
+# Where exported models are cached
+MODEL_CACHE_DIR = os.path.abspath(os.getenv('MODEL_CACHE_DIR', os.path.join(os.path.dirname(__file__), '../models')))
+
+# Models kept loaded per process; beyond this the least recently used one is dropped
+# (e.g. INT8 models calibrated on each job's own video)
+MAX_LOADED_MODELS = int(os.getenv('MAX_LOADED_MODELS', '3'))
+
+# (weights, device) -> (loaded model, inference lock), least recently used first
+_models = OrderedDict()
+_registry_lock = threading.Lock()
+_export_lock = threading.Lock()
+
+def _model_key(weights, device):
+    if os.path.exists(weights):
+        weights = os.path.abspath(weights)
+    return (weights, device)
+
+def _exported_path(weights, backend):
+    """Location of the cached export of `weights` for a backend."""
+    stem = os.path.splitext(os.path.basename(weights))[0]
+    if backend == 'onnx':
+        return os.path.join(MODEL_CACHE_DIR, f"{stem}.onnx")
+    return os.path.join(MODEL_CACHE_DIR, f"{stem}_openvino_model")
+
+def resolve_weights(weights=DEFAULT_WEIGHTS, backend=INFERENCE_BACKEND):
+    """
+    Return the model file to load for a backend, exporting it on first use.
+
+    PyTorch weights are returned unchanged. For 'onnx' and 'openvino' the
+    weights are exported once with dynamic input shapes (so batching and custom
+    imgsz keep working) and the artifact is cached in MODEL_CACHE_DIR.
+    Ultralytics loads the exported model with the same pre- and
+    post-processing as the PyTorch one.
+
+    Args:
+        weights: Path or name of the YOLO .pt weights
+        backend: One of INFERENCE_BACKENDS
+
+    Returns:
+        Path or name of the model to load
+    """
+    if backend not in INFERENCE_BACKENDS:
+        raise ValueError(f"Unknown inference backend: {backend}")
+    if backend == 'torch' or weights.endswith('.onnx') or weights.endswith('_openvino_model'):
+        # Already loadable as-is (PyTorch weights or an exported/quantized model)
+        return weights
+    target = _exported_path(weights, backend)
+    with _export_lock:
+        if os.path.exists(target):
+            return target
+        os.makedirs(MODEL_CACHE_DIR, exist_ok=True)
+        logger.info(f"Exporting {weights} to {backend}, caching it at {target}")
+        # Export from a private copy so concurrent workers never write the same files
+        source = YOLO(weights)
+        export_dir = tempfile.mkdtemp(dir=MODEL_CACHE_DIR)
+        try:
+            local_weights = shutil.copy(source.ckpt_path, export_dir)
+            exported = YOLO(local_weights).export(format=backend, dynamic=True)
+            try:
+                os.rename(exported, target)
+            except OSError:
+                # Another worker finished the same export first
+                if not os.path.exists(target):
+                    raise
+        finally:
+            shutil.rmtree(export_dir, ignore_errors=True)
+    return target
+
+def load_model(weights=DEFAULT_WEIGHTS, device=DEFAULT_DEVICE, backend='torch'):
+    """
+    Return the YOLO model for the given weights and device and the lock guarding it, loading it on first use.
+
+    The model is loaded once per process and reused by every job afterwards.
+    At most MAX_LOADED_MODELS models stay loaded; jobs still running on an
+    evicted model keep their own reference to it and its lock.
+
+    Ultralytics predictors keep per-call state, so jobs running in parallel
+    threads must hold the lock while calling the model.
+
+    Args:
+        weights: Path or name of the YOLO weights file
+        device: Device the model runs on (e.g. 'cpu', 'cuda:0')
+        backend: Inference backend the weights are exported to (see resolve_weights)
+
+    Returns:
+        Tuple of (ultralytics.YOLO instance, threading.Lock)
+    """
+    weights = resolve_weights(weights, backend)
+    key = _model_key(weights, device)
+    with _registry_lock:
+        entry = _models.get(key)
+        if entry is None:
+            logger.info(f"Loading YOLO model {weights} on {device}")
+            entry = (YOLO(weights, task='detect'), threading.Lock())
+            _models[key] = entry
+            while len(_models) > MAX_LOADED_MODELS:
+                evicted, _ = _models.popitem(last=False)
+                logger.info(f"Unloading least recently used YOLO model {evicted[0]} on {evicted[1]}")
+        else:
+            _models.move_to_end(key)
+    return entry
+
+def get_model(weights=DEFAULT_WEIGHTS, device=DEFAULT_DEVICE, backend='torch'):
+    """Return the YOLO model for the given weights and device (see load_model)."""
+    return load_model(weights, device, backend)[0]
+
+def get_inference_lock(weights=DEFAULT_WEIGHTS, device=DEFAULT_DEVICE, backend='torch'):
+    """Return the lock guarding inference on a cached model (see load_model)."""
+    return load_model(weights, device, backend)[1]
+
+def release_model(weights, device=DEFAULT_DEVICE, backend='torch'):
+    """Unload a model that will not be used again (e.g. one calibrated on a finished job's video)."""
+    with _registry_lock:
+        _models.pop(_model_key(resolve_weights(weights, backend), device), None)
+
+def warm_up_model(weights=DEFAULT_WEIGHTS, device=DEFAULT_DEVICE, backend=INFERENCE_BACKEND, imgsz=640):
+    """
+    Load a model and run one inference on a dummy frame.
+
+    The first inference builds the predictor and pays one-off setup costs, so
+    doing it at worker start keeps that latency out of the first job.
+    """
+    model, inference_lock = load_model(weights, device, backend)
+    dummy_frame = np.zeros((imgsz, imgsz, 3), dtype=np.uint8)
+    with inference_lock:
+        model(dummy_frame, classes=[0], device=device, verbose=False)
+    logger.info(f"Warmed up YOLO model {weights} ({backend}) on {device}")
+    return model
+
+def clear_models():
+    """Drop all cached models (e.g. after the weights on disk have changed)."""
+    with _registry_lock:
+        _models.clear()
@@ -5,33 +5,267 @@ Handles object/person detection and tracking logic for the backend.
 
 import cv2
 import numpy as np
-from ultralytics import YOLO
-from deep_sort_realtime.deepsort_tracker import DeepSort
 import os
+import math
+import queue
+import threading
 import logging
 from collections import Counter
+from .model_registry import load_model, release_model, resolve_weights, DEFAULT_WEIGHTS, DEFAULT_DEVICE, INFERENCE_BACKEND
+from .quantization import quantize_detector, QUANT_CALIBRATION, REFERENCE_CALIBRATION_VIDEO
+from .trackers import create_tracker, DEFAULT_TRACKER
+from .video_overlay import draw_tracks
+from .heatmap_maker import accumulate_heatmap
 
 logger = logging.getLogger(__name__)
 
-def detect_and_track(video_path, output_path, progress_callback=None, preview_folder=None, cancelled_flag=None):
+# Number of frames sent to YOLO in a single inference call
+DEFAULT_BATCH_SIZE = int(os.getenv('YOLO_BATCH_SIZE', '8'))
+
+# Run detection every DETECT_STRIDE frames; the tracker predicts positions in between
+DEFAULT_DETECT_STRIDE = int(os.getenv('DETECT_STRIDE', '1'))
+# Upper bound for the stride in adaptive mode (must stay below the tracker's max_age)
+DEFAULT_MAX_DETECT_STRIDE = int(os.getenv('MAX_DETECT_STRIDE', '8'))
+
+# Longest side (in pixels) frames are resized to before inference; 0 leaves sizing to YOLO's letterboxing
+DEFAULT_IMGSZ = int(os.getenv('YOLO_IMGSZ', '0'))
+
+# Motion gate: a frame counts as static when fewer than MOTION_AREA_THRESHOLD of the
+# pixels in its downscaled grayscale copy differ by more than MOTION_PIXEL_THRESHOLD
+# from the last frame that ran inference
+MOTION_THUMB_WIDTH = 160
+MOTION_PIXEL_THRESHOLD = 25
+MOTION_AREA_THRESHOLD = float(os.getenv('MOTION_AREA_THRESHOLD', '0.002'))
+
+# Maximum number of frames buffered between pipeline stages
+PIPELINE_QUEUE_SIZE = int(os.getenv('PIPELINE_QUEUE_SIZE', '4'))
+# Maximum number of full frames the tracking stage holds while it collects a detection batch
+# (at least batch_size); strided windows with more frames run inference on smaller batches
+MAX_WINDOW_FRAMES = int(os.getenv('MAX_WINDOW_FRAMES', '16'))
+
+# Marks the end of a pipeline queue
+_END = object()
+
+def _put(q, item, stop_event):
+    """Put an item on a bounded queue, giving up if stop_event gets set while waiting."""
+    while not stop_event.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def _decode_frames(cap, frame_queue, stop_event, cancelled_flag, errors, max_frames=None):
+    """Decoder stage: read up to max_frames frames from the capture and push them on frame_queue."""
+    try:
+        decoded = 0
+        while not stop_event.is_set() and (max_frames is None or decoded < max_frames):
+            decoded += 1
+            # Check for cancellation before decoding each frame
+            if cancelled_flag is not None and cancelled_flag():
+                logger.info("Job cancelled during object tracking loop.")
+                break
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if not _put(frame_queue, frame, stop_event):
+                return
+    except Exception as e:
+        errors.append(e)
+    _put(frame_queue, _END, stop_event)
+
+def _write_frames(out, write_queue, start_frame, total_frames, progress_callback, preview_folder, heatmap, errors):
+    """
+    Writer stage: annotate frames, write them to the output video, add the frame's
+    detections to the heatmap canvas and report progress.
+    With out=None frames are only annotated for the preview image.
+    """
+    while True:
+        item = write_queue.get()
+        if item is _END:
+            break
+        if errors:
+            # Keep draining so the tracking stage never blocks on a full queue
+            continue
+        try:
+            frame_count, frame, frame_detections = item
+            save_preview = preview_folder and frame_count % 10 == 0
+            if out is not None or save_preview:
+                draw_tracks(frame, frame_detections)
+
+            # Accumulate the heatmap while the frame is at hand
+            if heatmap is not None:
+                accumulate_heatmap(heatmap, frame_detections)
+
+            # Write frame
+            if out is not None:
+                out.write(frame)
+            # Save preview every 10 frames
+            if save_preview:
+                preview_path = os.path.join(preview_folder, 'preview_detections.jpg')
+                cv2.imwrite(preview_path, frame)
+
+            # Update progress
+            frames_done = frame_count - start_frame + 1
+            if progress_callback and frames_done % 10 == 0:
+                progress = min(1.0, frames_done / max(total_frames, 1))
+                progress_callback(progress)
+                logger.debug(f"Processing frame {frames_done}/{total_frames} ({progress*100:.1f}%)")
+        except Exception as e:
+            errors.append(e)
+
+def _adapt_stride(stride, track_ids, previous_track_ids, min_stride, max_stride):
+    """Raise the stride while the set of confirmed tracks stays the same, drop back when it changes."""
+    if track_ids == previous_track_ids:
+        return min(stride * 2, max_stride)
+    return min_stride
+
+def _inference_scale(width, height, imgsz):
+    """
+    Scale factor applied to frames before inference so their longest side is imgsz.
+    Frames are only ever downscaled.
+    """
+    if not imgsz:
+        return 1.0
+    return min(1.0, imgsz / max(width, height))
+
+def _extract_detections(result, scale, conf_threshold):
+    """
+    Convert one YOLO result into tracker detections in source coordinates.
+
+    The boxes are converted to NumPy once and filtered with a vectorized mask
+    instead of reading every box tensor separately.
+
+    Returns:
+        List of ([left, top, width, height], confidence, class_id) tuples as expected by the trackers
+    """
+    boxes = result.boxes
+    if boxes is None or len(boxes) == 0:
+        return []
+    xyxy = boxes.xyxy.cpu().numpy()
+    conf = boxes.conf.cpu().numpy()
+    keep = conf > conf_threshold
+    # Map the boxes back to source coordinates
+    xyxy = (xyxy[keep] / scale).astype(int)
+    ltwh = xyxy.copy()
+    ltwh[:, 2:] -= xyxy[:, :2]
+    return [(box, score, 0) for box, score in zip(ltwh.tolist(), conf[keep].tolist())]  # 0 is class_id for person
+
+def _motion_thumbnail(frame):
+    """Small blurred grayscale copy of a frame used by the motion gate."""
+    height, width = frame.shape[:2]
+    thumb_height = max(1, int(height * MOTION_THUMB_WIDTH / width))
+    small = cv2.resize(frame, (MOTION_THUMB_WIDTH, thumb_height), interpolation=cv2.INTER_AREA)
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    return cv2.GaussianBlur(gray, (5, 5), 0)
+
+def _is_static(thumbnail, reference, area_threshold=MOTION_AREA_THRESHOLD):
+    """Return True if the thumbnail shows no meaningful change from the reference."""
+    if reference is None:
+        return False
+    diff = cv2.absdiff(thumbnail, reference)
+    changed = np.count_nonzero(diff > MOTION_PIXEL_THRESHOLD)
+    return changed < area_threshold * diff.size
+
+def resolve_detector(video_path, weights=DEFAULT_WEIGHTS, backend=INFERENCE_BACKEND, quantized=False,
+                     calibration_video=None):
+    """
+    Resolve the detector model file a job runs on, exporting or quantizing it on first use.
+
+    Args:
+        video_path: The job's video (the calibration video when QUANT_CALIBRATION is 'job')
+        weights: YOLO weights
+        backend: Inference runtime ('torch', 'onnx' or 'openvino')
+        quantized: Use the INT8-quantized detector (runs on ONNX Runtime)
+        calibration_video: Video used to calibrate the INT8 detector (see detect_and_track)
+
+    Returns:
+        Tuple of (weights, backend, whether the detector was calibrated on this job's video)
+    """
+    if quantized:
+        # INT8 detector, calibrated once per calibration video and cached on disk
+        if calibration_video is None:
+            calibration_video = video_path if QUANT_CALIBRATION == 'job' else REFERENCE_CALIBRATION_VIDEO
+        job_calibrated = os.path.abspath(calibration_video) == os.path.abspath(video_path)
+        return quantize_detector(weights, calibration_video), 'onnx', job_calibrated
+    return resolve_weights(weights, backend), backend, False
+
+def detect_and_track(video_path, output_path, progress_callback=None, preview_folder=None, cancelled_flag=None,
+                     batch_size=DEFAULT_BATCH_SIZE, stats=None, weights=DEFAULT_WEIGHTS, device=DEFAULT_DEVICE,
+                     detect_stride=DEFAULT_DETECT_STRIDE, adaptive_stride=False, max_stride=DEFAULT_MAX_DETECT_STRIDE,
+                     motion_gate=False, imgsz=DEFAULT_IMGSZ, backend=INFERENCE_BACKEND,
+                     quantized=False, calibration_video=None, start_frame=0, end_frame=None,
+                     warmup_end=None, tracker=DEFAULT_TRACKER, heatmap=None):
     """
     Run person detection and tracking on a video.
     
+    The work is split into three stages connected by bounded queues:
+    a decoder thread prefetches frames, the calling thread runs YOLO on
+    batches of `batch_size` frames and feeds the per-frame results to
+    the tracker, and a writer thread draws the overlays, encodes the output
+    video and accumulates the heatmap. Frames are tracked and written in their
+    original order, so the video is decoded and encoded exactly once per job.
+
+    With `detect_stride` > 1 YOLO only runs on every k-th frame and the
+    tracker predicts positions on the frames in between, so every frame still
+    gets its track records and per-frame counts keep the same meaning. With
+    `adaptive_stride` the stride doubles (up to `max_stride`) while the set of
+    confirmed tracks stays the same and drops back to `detect_stride` when it
+    changes or while any track is still tentative.
+
+    With `motion_gate` a frame due for detection is first compared against
+    the last frame that ran inference; if nothing moved, inference is skipped
+    and the previous frame's tracks are reused unchanged.
+
+    With `imgsz` set, detection frames are resized once so their longest side
+    is `imgsz` pixels, YOLO runs at that size, and the boxes are scaled back to
+    source coordinates before they reach the tracker, heatmap and overlays.
+    
     Args:
         video_path: Path to input video file
-        output_path: Path to save the processed video
+        output_path: Path to save the processed video, or None to skip writing a video
         progress_callback: Optional callback function(progress) to report progress
         preview_folder: Optional folder to save preview images
         cancelled_flag: Optional callable that returns True if the job should be cancelled
+        batch_size: Number of frames per YOLO inference call
+        stats: Optional dict that is filled with processing metadata (batch size, stride, frames processed)
+        weights: YOLO weights to use (loaded once per process through the model registry)
+        device: Device to run inference on
+        detect_stride: Run detection on every detect_stride-th frame
+        adaptive_stride: Adjust the stride to the scene activity
+        max_stride: Largest stride used in adaptive mode
+        motion_gate: Skip inference on frames without motion
+        imgsz: Longest side of the frames passed to YOLO (None or 0 uses YOLO's default input size)
+        backend: Inference runtime ('torch', 'onnx' or 'openvino')
+        quantized: Use the INT8-quantized detector (runs on ONNX Runtime)
+        calibration_video: Video used to calibrate the INT8 detector; defaults to the job's
+            own video when QUANT_CALIBRATION is 'job', otherwise to testing/Mall.mp4
+        start_frame: First frame to process (frame numbers and timestamps stay absolute)
+        end_frame: Frame to stop before (None processes to the end of the video)
+        warmup_end: Optional frame before which frames are tracked (to warm the tracker up)
+            but left out of the frame counts in stats
+        tracker: Tracker to use ('deepsort' or 'iou', see trackers.py)
+        heatmap: Optional float32 canvas of the frame size; detections are added
+            to it in place (see heatmap_maker.accumulate_heatmap)
         
     Returns:
         Tuple of (output_video_path, detections, fps)
     """
-    # Load YOLO model
-    model = YOLO('yolov8n.pt')
+    batch_size = max(1, int(batch_size))
+    min_stride = max(1, int(detect_stride))
+    max_stride = max(min_stride, int(max_stride))
+    max_window = batch_size * (max_stride if adaptive_stride else min_stride)
+    max_window_frames = max(batch_size, MAX_WINDOW_FRAMES)
+
+    weights, backend, job_calibrated = resolve_detector(video_path, weights, backend, quantized, calibration_video)
+
+    # Get the shared YOLO model (loaded once per worker process)
+    model, inference_lock = load_model(weights, device, backend)
     
-    # Initialize DeepSORT tracker
-    tracker = DeepSort(max_age=30)
+    # Initialize tracker
+    tracker_name = tracker
+    tracker = create_tracker(tracker_name)
     
     # Open video
     cap = cv2.VideoCapture(video_path)
@@ -43,134 +277,198 @@ def detect_and_track(video_path, output_path, progress_callback=None, preview_fo
     height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
     fps = int(cap.get(cv2.CAP_PROP_FPS))
     total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+
+    # Restrict processing to [start_frame, end_frame)
+    if end_frame is None or end_frame > total_frames:
+        end_frame = total_frames
+    if start_frame > 0:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+    segment_frames = max(0, end_frame - start_frame)
+
+    # Inference resolution
+    scale = _inference_scale(width, height, imgsz)
+    infer_width = max(1, int(round(width * scale)))
+    infer_height = max(1, int(round(height * scale)))
+    predict_args = {'classes': [0], 'device': device, 'verbose': False}  # class 0 is person
+    if imgsz:
+        # YOLO needs a multiple of its 32 pixel stride
+        predict_args['imgsz'] = int(math.ceil(max(infer_width, infer_height) / 32) * 32)
     
     # Initialize video writer
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-    out = cv2.VideoWriter(output_path, fourcc, fps, (width, height))
-    
-    # Initialize heatmap
-    heatmap = np.zeros((height, width), dtype=np.float32)
+    out = None
+    if output_path:
+        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+        out = cv2.VideoWriter(output_path, fourcc, fps, (width, height))
+
+    # Start the decoder and writer stages
+    frame_queue = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    write_queue = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    stop_decoding = threading.Event()
+    errors = []
+    decoder = threading.Thread(target=_decode_frames, args=(cap, frame_queue, stop_decoding, cancelled_flag, errors, segment_frames))
+    writer = threading.Thread(target=_write_frames, args=(out, write_queue, start_frame, segment_frames, progress_callback, preview_folder, heatmap, errors))
+    decoder.daemon = True
+    writer.daemon = True
+    decoder.start()
+    writer.start()
     
     detections_for_heatmap = []
-    frame_count = 0
-    while cap.isOpened():
-        # Check for cancellation before processing each frame
-        if cancelled_flag is not None and cancelled_flag():
-            logger.info("Job cancelled during object tracking loop.")
-            break
-        ret, frame = cap.read()
-        if not ret:
-            break
-        timestamp = frame_count / fps  # seconds
-            
-        # Run YOLO detection
-        results = model(frame, classes=[0])  # class 0 is person
-        
-        # Process detections
-        detections = []
-        for r in results:
-            boxes = r.boxes
-            for box in boxes:
-                x1, y1, x2, y2 = map(int, box.xyxy[0])
-                conf = float(box.conf[0])
-                if conf > 0.5:  # Confidence threshold
-                    detections.append(([x1, y1, x2, y2], conf, 0))  # 0 is class_id for person
-        
-        # Update tracker
-        tracks = tracker.update_tracks(detections, frame=frame)
-        
-        # Update heatmap and draw tracks
-        for track in tracks:
-            if not track.is_confirmed():
-                continue
+    frame_count = start_frame
+    stride = min_stride
+    next_detection_frame = start_frame
+    detection_frame_count = 0
+    previous_track_ids = None
+    motion_reference = None
+    motion_skipped_frames = 0
+    # Counters at warmup_end; frames before it are not counted in stats
+    counted_start = start_frame if warmup_end is None else max(start_frame, warmup_end)
+    warmup_counts = (0, 0) if counted_start == start_frame else None
+    frame_tracks = []
+    try:
+        finished = False
+        while not finished and not errors:
+            # Stop early if the job was cancelled while frames were still buffered
+            if cancelled_flag is not None and cancelled_flag():
+                logger.info("Job cancelled during object tracking loop.")
+                break
+
+            # Collect decoded frames until the window holds a full batch of detection frames.
+            # Each frame is either detected, predicted by the tracker, or static (motion gate).
+            # The window size is capped so long static stretches are not buffered in memory,
+            # and only frames that are detected, written or previewed are held.
+            window = []
+            detection_batch = []
+            held_frames = 0
+            while len(detection_batch) < batch_size and len(window) < max_window and held_frames < max_window_frames:
+                frame = frame_queue.get()
+                if frame is _END:
+                    finished = True
+                    break
+                frame_index = frame_count + len(window)
+                action = 'predict'
+                if frame_index >= next_detection_frame:
+                    next_detection_frame = frame_index + stride
+                    action = 'detect'
+                    if motion_gate:
+                        thumbnail = _motion_thumbnail(frame)
+                        if _is_static(thumbnail, motion_reference):
+                            action = 'static'
+                        else:
+                            motion_reference = thumbnail
+                    if action == 'detect':
+                        if scale < 1.0:
+                            detection_batch.append(cv2.resize(frame, (infer_width, infer_height), interpolation=cv2.INTER_AREA))
+                        else:
+                            detection_batch.append(frame)
+                if action != 'detect' and out is None and not (preview_folder and frame_index % 10 == 0):
+                    # The writer only needs the frame's detections
+                    frame = None
+                if frame is not None:
+                    held_frames += 1
+                window.append((frame, action))
+            if not window:
+                break
                 
-            track_id = track.track_id
-            ltrb = track.to_ltrb()
+            # Run YOLO detection on the whole batch
+            results = iter([])
+            if detection_batch:
+                with inference_lock:
+                    results = iter(model(detection_batch, **predict_args))
             
-            # Update heatmap
-            x1, y1, x2, y2 = map(int, ltrb)
-            heatmap[y1:y2, x1:x2] += 1
-            
-            # Add detection for blend_heatmap
-            detections_for_heatmap.append({
-                'frame': frame_count,
-                'bbox': [x1, y1, x2, y2],
-                'track_id': track_id,
-                'timestamp': timestamp
-            })
-            
-            # Draw bounding box and ID with better contrast
-            cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-
-            # Add black background for text (ID)
-            text = f"ID: {track_id}"
-            (text_width, text_height), _ = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, 0.9, 2)
-            cv2.rectangle(frame, (x1, y1-text_height-10), (x1+text_width, y1), (0, 0, 0), -1)
-            cv2.putText(frame, text, (x1, y1-5),
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.9, (255, 255, 255), 2)
-
-            # Draw a small white dot at the center of the box
-            center_x = int((x1 + x2) / 2)
-            center_y = int((y1 + y2) / 2)
-            cv2.circle(frame, (center_x, center_y), 4, (255, 255, 255), -1)
-        
-        # Write frame
-        out.write(frame)
-        # Save preview every 10 frames
-        if preview_folder and frame_count % 10 == 0:
-            preview_path = os.path.join(preview_folder, 'preview_detections.jpg')
-            cv2.imwrite(preview_path, frame)
-        
-        # Update progress
-        frame_count += 1
-        if progress_callback and frame_count % 10 == 0:
-            progress = frame_count / total_frames
-            progress_callback(progress)
-            logger.debug(f"Processing frame {frame_count}/{total_frames} ({progress*100:.1f}%)")
-    
-    # Release resources
-    cap.release()
-    out.release()
-    
-    return output_path, detections_for_heatmap, fps
+            for frame, action in window:
+                timestamp = frame_count / fps  # seconds
+                if frame_count == counted_start:
+                    warmup_counts = (detection_frame_count, motion_skipped_frames)
 
-def analyze_peak_hours(detections, fps, bin_minutes=5):
-    """
-    Analyze detections to find peak time frames.
-    - detections: list of dicts, each with a 'timestamp' (in seconds)
-    - fps: frames per second of the video
-    - bin_minutes: size of each time bin in minutes
-    Returns: list of (start_time, end_time, count) for the busiest bins
-    """
-    # Gather all timestamps
-    timestamps = [det['timestamp'] for det in detections if 'timestamp' in det]
-    if not timestamps:
-        return []
+                if action == 'static':
+                    # Nothing moved since the last inference, reuse the previous tracks as they are
+                    motion_skipped_frames += 1
+                    frame_tracks = [
+                        dict(detection, frame=frame_count, timestamp=timestamp)
+                        for detection in frame_tracks
+                    ]
+                    detections_for_heatmap.extend(frame_tracks)
+                    write_queue.put((frame_count, frame, frame_tracks))
+                    frame_count += 1
+                    continue
+
+                if action == 'detect':
+                    # Process detections
+                    detections = _extract_detections(next(results), scale, tracker.min_confidence)
+                    
+                    # Update tracker
+                    tracks = tracker.update(detections, frame)
+                    detection_frame_count += 1
+                else:
+                    # No detection on this frame, let the tracker predict
+                    tracks = tracker.predict()
+                
+                frame_tracks = []
+                for track in tracks:
+                    if not track.is_confirmed():
+                        continue
+                        
+                    track_id = track.track_id
+                    x1, y1, x2, y2 = map(int, track.to_ltrb())
+                    
+                    frame_tracks.append({
+                        'frame': frame_count,
+                        'bbox': [x1, y1, x2, y2],
+                        'track_id': track_id,
+                        'timestamp': timestamp
+                    })
+                detections_for_heatmap.extend(frame_tracks)
+
+                if action == 'detect' and adaptive_stride:
+                    track_ids = set(t['track_id'] for t in frame_tracks)
+                    stride = _adapt_stride(stride, track_ids, previous_track_ids, min_stride, max_stride)
+                    previous_track_ids = track_ids
+                    # Tentative tracks need consecutive detections to be confirmed (e.g. someone entering)
+                    if any(not track.is_confirmed() for track in tracks):
+                        stride = min_stride
+                    # React to a dropped stride without waiting out the previous long one
+                    next_detection_frame = min(next_detection_frame, frame_count + stride)
 
-    # Bin timestamps into intervals
-    bin_seconds = bin_minutes * 60
-    max_time = max(timestamps)
-    num_bins = int(np.ceil(max_time / bin_seconds))
-    bins = [0] * (num_bins + 1)
-
-    for t in timestamps:
-        bin_idx = int(t // bin_seconds)
-        bins[bin_idx] += 1
-
-    # Find the bin(s) with the most detections
-    peak_count = max(bins)
-    peak_bins = [i for i, count in enumerate(bins) if count == peak_count]
-
-    # Format results as readable time ranges
-    results = []
-    for bin_idx in peak_bins:
-        start = bin_idx * bin_minutes
-        end = (bin_idx + 1) * bin_minutes
-        results.append({
-            "start_minute": start,
-            "end_minute": end,
-            "count": peak_count
-        })
-    return results
-
-# Add more tracking-related utilities as needed 
\ No newline at end of file
+                # Hand the frame over to the writer stage for drawing, encoding and the heatmap
+                write_queue.put((frame_count, frame, frame_tracks))
+                frame_count += 1
+    finally:
+        # Shut the pipeline down and release resources
+        stop_decoding.set()
+        write_queue.put(_END)
+        writer.join()
+        decoder.join()
+        cap.release()
+        if out is not None:
+            out.release()
+        # A detector calibrated on this job's video is of no use to other jobs
+        if job_calibrated:
+            release_model(weights, device, backend)
+
+    if errors:
+        raise errors[0]
+
+    if stats is not None:
+        if warmup_counts is None:
+            # Stopped within the warm-up window
+            warmup_counts = (detection_frame_count, motion_skipped_frames)
+        frames_processed = max(0, frame_count - counted_start)
+        detection_frame_count -= warmup_counts[0]
+        motion_skipped_frames -= warmup_counts[1]
+        stats['backend'] = backend
+        stats['model'] = os.path.basename(weights)
+        stats['quantized'] = bool(quantized)
+        stats['tracker'] = tracker_name
+        stats['batch_size'] = batch_size
+        stats['detect_stride'] = min_stride
+        stats['adaptive_stride'] = bool(adaptive_stride)
+        stats['max_stride'] = max_stride if adaptive_stride else min_stride
+        stats['frames_processed'] = frames_processed
+        stats['detection_frames'] = detection_frame_count
+        stats['mean_stride'] = round(frames_processed / detection_frame_count, 2) if detection_frame_count else None
+        stats['motion_gate'] = bool(motion_gate)
+        stats['motion_skipped_frames'] = motion_skipped_frames
+        stats['imgsz'] = predict_args.get('imgsz')
+        stats['inference_scale'] = round(scale, 4)
+    
+    return output_path, detections_for_heatmap, fps
@@ -0,0 +1,234 @@
+"""
+parallel_tracking.py
+Segment-parallel person detection and tracking for long videos.
+
+The video is split into time segments that are tracked in separate worker
+processes, each with its own detector and tracker. Every segment after the
+first also tracks a short warm-up window before its start; the tracks seen in
+that window are matched against the previous segment's tracks over the same
+frames, so track IDs continue across segment boundaries.
+"""
+
+import os
+import logging
+import multiprocessing
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import cv2
+import numpy as np
+
+from .object_tracking import detect_and_track, resolve_detector
+
+logger = logging.getLogger(__name__)
+
+# Number of worker processes used for one job (1 disables segment-parallel processing)
+DEFAULT_SEGMENT_WORKERS = int(os.getenv('SEGMENT_WORKERS', '1'))
+# Length of the warm-up window tracked before each segment and used for stitching
+SEGMENT_OVERLAP_SECONDS = float(os.getenv('SEGMENT_OVERLAP_SECONDS', '2'))
+# Minimum mean IoU over the overlap window for two tracks to be considered the same person
+STITCH_IOU_THRESHOLD = 0.3
+
+def _init_worker(num_threads):
+    """Limit each worker's intra-op threads so the processes do not oversubscribe the CPU."""
+    import torch
+    torch.set_num_threads(num_threads)
+    cv2.setNumThreads(num_threads)
+
+def _track_segment(video_path, warmup_start, start, end, segment_index, progress, cancel_event, options):
+    """
+    Worker entry point: track frames [warmup_start, end) of the video.
+    Only frames from `start` on are counted in the segment's stats.
+    """
+    def report_progress(p):
+        progress[segment_index] = p
+
+    stats = {}
+    _, detections, fps = detect_and_track(
+        video_path,
+        None,
+        progress_callback=report_progress,
+        cancelled_flag=cancel_event.is_set,
+        stats=stats,
+        start_frame=warmup_start,
+        end_frame=end,
+        warmup_end=start,
+        **options
+    )
+    progress[segment_index] = 1.0
+    return detections, fps, stats
+
+def plan_segments(total_frames, num_segments, overlap_frames):
+    """
+    Split a video into contiguous segments.
+
+    Returns:
+        List of (start, end, warmup_start) frame numbers; warmup_start is where the
+        segment's tracker starts, start is the first frame whose detections it keeps.
+    """
+    num_segments = max(1, min(num_segments, total_frames // max(overlap_frames * 2, 1) or 1))
+    bounds = np.linspace(0, total_frames, num_segments + 1).astype(int)
+    return [
+        (int(start), int(end), int(max(0, start - overlap_frames)) if i > 0 else 0)
+        for i, (start, end) in enumerate(zip(bounds[:-1], bounds[1:]))
+    ]
+
+def _iou(a, b):
+    ix = max(0, min(a[2], b[2]) - max(a[0], b[0]))
+    iy = max(0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = ix * iy
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+def _match_tracks(previous, current, iou_threshold=STITCH_IOU_THRESHOLD):
+    """
+    Match tracks of two segments over the frames both of them tracked.
+
+    Args:
+        previous: detections of the previous segment (already carrying global IDs) in the overlap window
+        current: detections of the current segment (local IDs) in the same window
+
+    Returns:
+        dict mapping current local track ID -> previous global track ID
+    """
+    previous_by_frame = defaultdict(list)
+    for det in previous:
+        previous_by_frame[det['frame']].append(det)
+
+    # Sum the IoU of every track pair over the frames they share
+    iou_sums = defaultdict(float)
+    frames_seen = defaultdict(int)
+    for det in current:
+        frames_seen[det['track_id']] += 1
+        for other in previous_by_frame.get(det['frame'], []):
+            overlap = _iou(det['bbox'], other['bbox'])
+            if overlap > 0:
+                iou_sums[(det['track_id'], other['track_id'])] += overlap
+
+    # Greedy one-to-one assignment, best mean IoU first
+    scores = sorted(
+        ((total / frames_seen[local], local, global_id) for (local, global_id), total in iou_sums.items()),
+        reverse=True
+    )
+    mapping = {}
+    used = set()
+    for score, local, global_id in scores:
+        if score < iou_threshold:
+            break
+        if local in mapping or global_id in used:
+            continue
+        mapping[local] = global_id
+        used.add(global_id)
+    return mapping
+
+def stitch_segments(segments, segment_detections):
+    """
+    Merge per-segment detections into one list with track IDs that are unique across the video.
+
+    Args:
+        segments: list of (start, end, warmup_start) as returned by plan_segments
+        segment_detections: list of per-segment detection lists (local track IDs)
+
+    Returns:
+        Tuple of (detections sorted by frame, number of tracks continued across a boundary)
+    """
+    merged = []
+    next_id = 1
+    stitched = 0
+    previous_core = []
+    for (start, end, warmup_start), detections in zip(segments, segment_detections):
+        warmup = [det for det in detections if det['frame'] < start]
+        core = [det for det in detections if det['frame'] >= start]
+
+        # Continue tracks that were already seen by the previous segment
+        mapping = {}
+        if warmup and previous_core:
+            overlap = [det for det in previous_core if det['frame'] >= warmup_start]
+            mapping = _match_tracks(overlap, warmup)
+            stitched += len(mapping)
+
+        for det in core:
+            local = det['track_id']
+            if local not in mapping:
+                mapping[local] = str(next_id)
+                next_id += 1
+            merged.append(dict(det, track_id=mapping[local]))
+        previous_core = merged[len(merged) - len(core):]
+    merged.sort(key=lambda det: det['frame'])
+    return merged, stitched
+
+def detect_and_track_parallel(video_path, num_workers=DEFAULT_SEGMENT_WORKERS, progress_callback=None,
+                              cancelled_flag=None, stats=None, overlap_seconds=SEGMENT_OVERLAP_SECONDS, **options):
+    """
+    Run detection and tracking on time segments of a video in parallel worker processes.
+
+    No annotated video is written; render it afterwards from the returned
+    detections if needed.
+
+    Args:
+        video_path: Path to input video file
+        num_workers: Number of worker processes (and segments)
+        progress_callback: Optional callback function(progress) to report overall progress
+        cancelled_flag: Optional callable that returns True if the job should be cancelled
+        stats: Optional dict that is filled with processing metadata
+        overlap_seconds: Warm-up window tracked before each segment for ID stitching
+        **options: Further keyword arguments passed to detect_and_track in every worker
+
+    Returns:
+        Tuple of (None, detections, fps)
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise Exception("Error opening video file")
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = int(cap.get(cv2.CAP_PROP_FPS))
+    cap.release()
+
+    segments = plan_segments(total_frames, num_workers, int(overlap_seconds * fps))
+
+    # Export or quantize the detector once here: the workers are separate processes, so
+    # resolving it in each of them would run the same export or calibration concurrently
+    quantized = options.get('quantized', False)
+    weights, backend, _ = resolve_detector(
+        video_path,
+        **{name: options[name] for name in ('weights', 'backend', 'quantized', 'calibration_video') if name in options}
+    )
+    options = dict(options, weights=weights, backend=backend, quantized=False, calibration_video=None)
+    threads_per_worker = max(1, (os.cpu_count() or 1) // len(segments))
+    logger.info(f"Tracking {video_path} in {len(segments)} segments with {threads_per_worker} threads each")
+
+    # Spawned workers do not inherit the parent's threads or loaded models
+    context = multiprocessing.get_context('spawn')
+    with context.Manager() as manager:
+        progress = manager.dict()
+        cancel_event = manager.Event()
+        with ProcessPoolExecutor(max_workers=len(segments), mp_context=context,
+                                 initializer=_init_worker, initargs=(threads_per_worker,)) as pool:
+            futures = [
+                pool.submit(_track_segment, video_path, warmup_start, start, end, i, progress, cancel_event, options)
+                for i, (start, end, warmup_start) in enumerate(segments)
+            ]
+            pending = set(futures)
+            while pending:
+                _, pending = wait(pending, timeout=1.0, return_when=FIRST_COMPLETED)
+                if cancelled_flag is not None and cancelled_flag() and not cancel_event.is_set():
+                    logger.info("Job cancelled during segment-parallel tracking.")
+                    cancel_event.set()
+                if progress_callback:
+                    progress_callback(sum(progress.values()) / len(segments))
+            results = [future.result() for future in futures]
+
+    detections, stitched = stitch_segments(segments, [result[0] for result in results])
+
+    if stats is not None:
+        segment_stats = [result[2] for result in results]
+        stats.update(segment_stats[0])
+        stats['quantized'] = bool(quantized)
+        # Segment stats leave out their warm-up windows, so every frame is counted once
+        for key in ('frames_processed', 'detection_frames', 'motion_skipped_frames'):
+            stats[key] = sum(s.get(key, 0) for s in segment_stats)
+        stats['mean_stride'] = round(stats['frames_processed'] / stats['detection_frames'], 2) if stats['detection_frames'] else None
+        stats['segments'] = len(segments)
+        stats['segment_overlap_seconds'] = overlap_seconds
+        stats['stitched_tracks'] = stitched
+
+    return None, detections, fps
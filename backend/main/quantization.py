@@ -0,0 +1,173 @@
+"""
+quantization.py
+INT8 post-training quantization of the YOLO person detector for CPU deployments.
+"""
+
+import os
+import glob
+import hashlib
+import threading
+import logging
+import cv2
+import numpy as np
+import onnx
+from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+from ultralytics.data.augment import LetterBox
+
+from .model_registry import resolve_weights, DEFAULT_WEIGHTS, MODEL_CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+# Video used for calibration when a job does not calibrate on its own footage
+REFERENCE_CALIBRATION_VIDEO = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../testing/Mall.mp4'))
+
+# 'job' calibrates on the job's own video, 'reference' on REFERENCE_CALIBRATION_VIDEO
+QUANT_CALIBRATION = os.getenv('QUANT_CALIBRATION', 'reference')
+CALIBRATION_FRAMES = int(os.getenv('QUANT_CALIBRATION_FRAMES', '64'))
+CALIBRATION_IMGSZ = 640
+
+# INT8 models kept in MODEL_CACHE_DIR per weights file; beyond this the least recently
+# used ones are deleted (job-calibrated models would otherwise pile up)
+QUANT_CACHE_MAX_MODELS = int(os.getenv('QUANT_CACHE_MAX_MODELS', '4'))
+
+# Static quantization settings. They are part of the cache key, so changing them
+# recalibrates instead of serving a model quantized with the old settings
+_QUANT_FORMAT = QuantFormat.QDQ
+_ACTIVATION_TYPE = QuantType.QUInt8
+_WEIGHT_TYPE = QuantType.QInt8
+
+# The box decoding (DFL, anchors, concat) after the detection head's convolutions loses
+# too much precision in INT8, keep it in FP32
+_HEAD_NODE_PREFIX = '/model.22/'
+
+_quantize_lock = threading.Lock()
+# (FP32 model path, mtime) -> names of the nodes kept in FP32
+_excluded_nodes_cache = {}
+
+def sample_calibration_frames(video_path, num_frames=CALIBRATION_FRAMES, imgsz=CALIBRATION_IMGSZ):
+    """
+    Sample evenly spaced frames from a video and preprocess them like YOLO does.
+
+    Returns:
+        List of float32 arrays of shape (1, 3, imgsz, imgsz)
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise ValueError(f"Could not open calibration video: {video_path}")
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    letterbox = LetterBox((imgsz, imgsz), auto=False)
+    frames = []
+    for index in np.linspace(0, max(total_frames - 1, 0), num_frames).astype(int):
+        cap.set(cv2.CAP_PROP_POS_FRAMES, int(index))
+        ret, frame = cap.read()
+        if not ret:
+            continue
+        image = letterbox(image=frame)
+        image = image[..., ::-1].transpose(2, 0, 1)  # BGR HWC -> RGB CHW
+        frames.append(np.ascontiguousarray(image, dtype=np.float32)[None] / 255.0)
+    cap.release()
+    if not frames:
+        raise ValueError(f"No frames could be read from calibration video: {video_path}")
+    return frames
+
+class _FrameCalibrationReader(CalibrationDataReader):
+    """Feeds preprocessed video frames to the ONNX Runtime calibrator."""
+
+    def __init__(self, input_name, frames):
+        self._inputs = iter({input_name: frame} for frame in frames)
+
+    def get_next(self):
+        return next(self._inputs, None)
+
+def _excluded_nodes(fp32_path):
+    """Names of the FP32 model's box decoding nodes, which are kept in FP32 (see _HEAD_NODE_PREFIX)."""
+    key = (fp32_path, os.stat(fp32_path).st_mtime)
+    if key not in _excluded_nodes_cache:
+        _excluded_nodes_cache[key] = sorted(
+            node.name for node in onnx.load(fp32_path).graph.node
+            if node.name.startswith(_HEAD_NODE_PREFIX) and node.op_type != 'Conv'
+        )
+    return _excluded_nodes_cache[key]
+
+def _quantization_tag(video_path, num_frames, excluded_nodes):
+    """
+    Short hash identifying a quantized model: the calibration video (by path, size and mtime),
+    the frame count and the quantization settings, including the nodes kept in FP32.
+    """
+    stat = os.stat(video_path)
+    key = ':'.join([
+        os.path.abspath(video_path), str(stat.st_size), str(int(stat.st_mtime)), str(num_frames),
+        str(_QUANT_FORMAT), str(_ACTIVATION_TYPE), str(_WEIGHT_TYPE), ','.join(excluded_nodes)
+    ])
+    return hashlib.sha1(key.encode()).hexdigest()[:12]
+
+def quantized_model_path(weights=DEFAULT_WEIGHTS, calibration_video=REFERENCE_CALIBRATION_VIDEO,
+                         num_frames=CALIBRATION_FRAMES):
+    """Location of the cached INT8 model for a weights file, calibration video and the quantization settings."""
+    stem = os.path.splitext(os.path.basename(weights))[0]
+    excluded_nodes = _excluded_nodes(resolve_weights(weights, 'onnx'))
+    tag = _quantization_tag(calibration_video, num_frames, excluded_nodes)
+    return os.path.join(MODEL_CACHE_DIR, f"{stem}_int8_{tag}.onnx")
+
+def _prune_quantized_models(weights, max_models=QUANT_CACHE_MAX_MODELS):
+    """Delete the least recently used INT8 models of a weights file beyond max_models."""
+    stem = os.path.splitext(os.path.basename(weights))[0]
+    paths = sorted(glob.glob(os.path.join(MODEL_CACHE_DIR, f"{stem}_int8_*.onnx")), key=os.path.getmtime, reverse=True)
+    for path in paths[max_models:]:
+        try:
+            os.remove(path)
+            logger.info(f"Deleted least recently used INT8 detector {path}")
+        except OSError:
+            pass
+
+def quantize_detector(weights=DEFAULT_WEIGHTS, calibration_video=REFERENCE_CALIBRATION_VIDEO,
+                      num_frames=CALIBRATION_FRAMES):
+    """
+    Return an INT8 ONNX version of the detector, calibrating and caching it on first use.
+
+    The FP32 ONNX export is statically quantized (QDQ format, INT8 weights and
+    UINT8 activations) with activation ranges calibrated on frames sampled from
+    `calibration_video`. The box decoding after the detection head's
+    convolutions stays in FP32. The model metadata (class names, stride,
+    imgsz) is copied over so ultralytics loads it like the FP32 export.
+
+    Args:
+        weights: YOLO .pt weights to quantize
+        calibration_video: Video whose frames are used for calibration
+        num_frames: Number of calibration frames
+
+    Returns:
+        Path to the cached INT8 .onnx model
+    """
+    target = quantized_model_path(weights, calibration_video, num_frames)
+    with _quantize_lock:
+        if os.path.exists(target):
+            # Mark as recently used for pruning
+            os.utime(target)
+            return target
+        fp32_path = resolve_weights(weights, 'onnx')
+        fp32_model = onnx.load(fp32_path)
+        input_name = fp32_model.graph.input[0].name
+
+        logger.info(f"Calibrating INT8 detector on {num_frames} frames of {calibration_video}")
+        frames = sample_calibration_frames(calibration_video, num_frames)
+        tmp_path = f"{target}.{os.getpid()}.tmp"
+        quantize_static(
+            fp32_path,
+            tmp_path,
+            _FrameCalibrationReader(input_name, frames),
+            quant_format=_QUANT_FORMAT,
+            activation_type=_ACTIVATION_TYPE,
+            weight_type=_WEIGHT_TYPE,
+            nodes_to_exclude=_excluded_nodes(fp32_path)
+        )
+
+        # Keep the ultralytics metadata so the model loads with the right names/stride
+        int8_model = onnx.load(tmp_path)
+        del int8_model.metadata_props[:]
+        int8_model.metadata_props.extend(fp32_model.metadata_props)
+        onnx.save(int8_model, tmp_path)
+        os.replace(tmp_path, target)
+        logger.info(f"Cached INT8 detector at {target}")
+        _prune_quantized_models(weights)
+    return target
@@ -0,0 +1,196 @@
+"""
+render_cache.py
+On-disk cache of rendered heatmaps with request coalescing, per-request progress and LRU eviction.
+
+A render request is identified by a key (job, time range and render
+parameters). Submitting a key whose file already exists completes at once;
+submitting a key that is still being rendered joins the running render
+instead of starting another one. Cached files are evicted least recently
+used first once their total size exceeds RENDER_CACHE_MAX_BYTES. The status
+of a finished request is kept for RENDER_STATUS_TTL seconds, or until its
+files are evicted.
+"""
+
+import os
+import glob
+import time
+import fnmatch
+import shutil
+import hashlib
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Total size of the cached renders kept on disk
+RENDER_CACHE_MAX_BYTES = int(float(os.getenv('RENDER_CACHE_MAX_MB', '500')) * 2 ** 20)
+# How long the status of a finished (done or failed) request is kept
+RENDER_STATUS_TTL = int(os.getenv('RENDER_STATUS_TTL_SECONDS', '3600'))
+
+# key -> {'status': 'running' | 'done' | 'error', 'progress': 0-1, 'paths': [...], 'error': str,
+#         'on_done_error': str, 'finished': time.time() of completion}
+_requests = {}
+# Glob patterns of the cached files that take part in eviction
+_patterns = []
+_lock = threading.Lock()
+
+def params_tag(params):
+    """Short hash of the render parameters, used in cache file names."""
+    key = ','.join(f"{name}={params[name]}" for name in sorted(params))
+    return hashlib.sha1(key.encode()).hexdigest()[:8]
+
+def touch(path):
+    """Mark a cached file as recently used."""
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+def submit(key, paths, render, on_done=None):
+    """
+    Render `paths` in a background thread unless they are cached or already being rendered.
+
+    Args:
+        key: Identifies the request (e.g. job ID, time range and render parameters)
+        paths: Files the render produces; the first one decides whether the request is cached
+        render: Function render(progress_callback) writing `paths`
+        on_done: Optional function called after a successful render (e.g. to upload the result).
+            If it fails the request is still 'done', since its files are valid, and the
+            failure is reported as 'on_done_error'
+
+    Returns:
+        'cached', 'joined' (an identical render is in flight) or 'started'
+    """
+    with _lock:
+        _prune_requests()
+        entry = _requests.get(key)
+        if entry and entry['status'] == 'running':
+            return 'joined'
+        if os.path.exists(paths[0]):
+            for path in paths:
+                touch(path)
+            _requests[key] = {'status': 'done', 'progress': 1.0, 'paths': paths, 'finished': time.time()}
+            return 'cached'
+        entry = {'status': 'running', 'progress': 0.0, 'paths': paths}
+        _requests[key] = entry
+
+    def progress_callback(progress):
+        entry['progress'] = min(progress, 0.99)
+
+    def run():
+        try:
+            render(progress_callback)
+            status = 'done'
+        except Exception as e:
+            status = 'error'
+            entry['error'] = str(e)
+            logger.error(f"Error rendering {key}: {str(e)}", exc_info=True)
+        if status == 'done' and on_done is not None:
+            try:
+                on_done()
+            except Exception as e:
+                entry['on_done_error'] = str(e)
+                logger.error(f"Error after rendering {key}: {str(e)}", exc_info=True)
+        entry['progress'] = 1.0
+        entry['finished'] = time.time()
+        # Set last: a finished entry always has its completion time
+        entry['status'] = status
+        evict()
+
+    thread = threading.Thread(target=run)
+    thread.daemon = True
+    thread.start()
+    return 'started'
+
+def get_status(key):
+    """Status dict of a request ({'status', 'progress', ...}), or None if it was never submitted."""
+    entry = _requests.get(key)
+    return dict(entry) if entry else None
+
+def register_pattern(pattern):
+    """Add a glob pattern of cached files that take part in eviction."""
+    if pattern not in _patterns:
+        _patterns.append(pattern)
+
+def _remove(path):
+    """Delete a cached file or directory."""
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    else:
+        os.remove(path)
+
+def remove_stale(pattern, current_patterns):
+    """
+    Delete cached files (and directories) matching `pattern` whose names match none of `current_patterns`.
+
+    Renders named after out-of-date parameters (or from before the names carried
+    them) are never served again but would count against RENDER_CACHE_MAX_BYTES.
+
+    Args:
+        pattern: Glob pattern of the cached files
+        current_patterns: fnmatch patterns of the file names of current renders
+
+    Returns:
+        Number of files and directories deleted
+    """
+    removed = 0
+    with _lock:
+        for path in glob.glob(pattern):
+            name = os.path.basename(path)
+            if any(fnmatch.fnmatch(name, current) for current in current_patterns):
+                continue
+            try:
+                _remove(path)
+                removed += 1
+            except OSError:
+                pass
+    if removed:
+        logger.info(f"Removed {removed} stale cached renders matching {pattern}")
+    return removed
+
+def _prune_requests():
+    """
+    Forget finished requests older than RENDER_STATUS_TTL and completed requests whose files are gone.
+    Must be called with _lock held.
+    """
+    expired = time.time() - RENDER_STATUS_TTL
+    for key in [k for k, entry in _requests.items() if entry['status'] != 'running' and (
+            entry['finished'] < expired
+            or (entry['status'] == 'done' and not os.path.exists(entry['paths'][0])))]:
+        del _requests[key]
+
+def _size(path):
+    """Size of a file, or of all files in a directory (e.g. a tile pyramid)."""
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    return sum(
+        os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names
+    )
+
+def evict(max_bytes=None):
+    """Delete least recently used cached files (and directories) until their total size is below max_bytes."""
+    max_bytes = RENDER_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    with _lock:
+        in_use = set(
+            path for entry in _requests.values() if entry['status'] == 'running' for path in entry['paths']
+        )
+        files = []
+        for pattern in _patterns:
+            for path in glob.glob(pattern):
+                try:
+                    files.append((os.stat(path).st_mtime, _size(path), path))
+                except OSError:
+                    continue
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= max_bytes:
+                break
+            if path in in_use:
+                continue
+            try:
+                _remove(path)
+                total -= size
+                logger.info(f"Evicted cached render {path}")
+            except OSError:
+                pass
+        _prune_requests()
@@ -0,0 +1,152 @@
+"""
+tiles.py
+Tile pyramid and downscaled previews of rendered heatmap images, for zoomable and thumbnail views.
+
+The pyramid of a heatmap image <name>.jpg lives in <name>_tiles/:
+    <name>_tiles/tiles.json      width, height, tile_size and max_zoom
+    <name>_tiles/<z>/<x>_<y>.jpg TILE_SIZE x TILE_SIZE tiles (smaller at the right and bottom edges)
+Zoom level max_zoom is the full-resolution image; every level below halves it,
+down to level 0 which fits in a single tile. Previews are <name>_w<width>.jpg.
+"""
+
+import os
+import json
+import math
+import shutil
+import hashlib
+import functools
+import tempfile
+import threading
+import cv2
+
+TILE_SIZE = 256
+# Widths of the downscaled previews served to thumbnails and dashboards
+PREVIEW_WIDTHS = (256, 512, 1024)
+TILE_JPEG_QUALITY = 85
+
+_build_lock = threading.Lock()
+
+def tiles_dir(image_path):
+    """Directory holding the tile pyramid of a heatmap image."""
+    return os.path.splitext(image_path)[0] + '_tiles'
+
+def preview_path(image_path, width):
+    return f"{os.path.splitext(image_path)[0]}_w{width}.jpg"
+
+@functools.lru_cache(maxsize=1024)
+def _content_hash(path, inode, size):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(2 ** 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+def image_version(image_path):
+    """
+    Short hash of a heatmap image's contents, identifying it (and its previews and tiles) in URLs.
+    Renders move a new file into place, so the hash is computed once per file (inode).
+    """
+    stat = os.stat(image_path)
+    return _content_hash(image_path, stat.st_ino, stat.st_size)
+
+def _write_jpeg(path, image):
+    """Write a JPEG next to its final path and move it into place, so it is never served half-written."""
+    tmp_path = f"{path}.{threading.get_ident()}.tmp.jpg"
+    cv2.imwrite(tmp_path, image, [cv2.IMWRITE_JPEG_QUALITY, TILE_JPEG_QUALITY])
+    os.replace(tmp_path, path)
+
+def build_tile_pyramid(image_path):
+    """
+    Cut a heatmap image into its tile pyramid (see module docstring), once.
+
+    The pyramid is written to a temporary directory and moved into place when
+    complete, so readers never see a partial pyramid.
+
+    Returns:
+        The pyramid metadata dict
+    """
+    target = tiles_dir(image_path)
+    with _build_lock:
+        if os.path.exists(os.path.join(target, 'tiles.json')):
+            return load_tile_metadata(image_path)
+        image = cv2.imread(image_path)
+        if image is None:
+            raise ValueError(f"Could not load heatmap image: {image_path}")
+        height, width = image.shape[:2]
+        max_zoom = max(0, math.ceil(math.log2(max(height, width) / TILE_SIZE)))
+        metadata = {'width': width, 'height': height, 'tile_size': TILE_SIZE, 'max_zoom': max_zoom}
+
+        build_dir = tempfile.mkdtemp(dir=os.path.dirname(target))
+        try:
+            level = image
+            for zoom in range(max_zoom, -1, -1):
+                if zoom < max_zoom:
+                    # Halve the previous level
+                    level = cv2.resize(
+                        level,
+                        (max(1, math.ceil(level.shape[1] / 2)), max(1, math.ceil(level.shape[0] / 2))),
+                        interpolation=cv2.INTER_AREA
+                    )
+                zoom_dir = os.path.join(build_dir, str(zoom))
+                os.makedirs(zoom_dir)
+                for y in range(0, level.shape[0], TILE_SIZE):
+                    for x in range(0, level.shape[1], TILE_SIZE):
+                        _write_jpeg(
+                            os.path.join(zoom_dir, f"{x // TILE_SIZE}_{y // TILE_SIZE}.jpg"),
+                            level[y:y + TILE_SIZE, x:x + TILE_SIZE]
+                        )
+            with open(os.path.join(build_dir, 'tiles.json'), 'w') as f:
+                json.dump(metadata, f)
+            shutil.rmtree(target, ignore_errors=True)
+            os.rename(build_dir, target)
+        except Exception:
+            shutil.rmtree(build_dir, ignore_errors=True)
+            raise
+    return metadata
+
+def load_tile_metadata(image_path):
+    with open(os.path.join(tiles_dir(image_path), 'tiles.json'), 'r') as f:
+        return json.load(f)
+
+def tile_path(image_path, zoom, x, y):
+    """
+    Path of one tile, building the pyramid on first use.
+
+    Returns:
+        The tile's path, or None if the tile is outside the pyramid
+    """
+    metadata = build_tile_pyramid(image_path)
+    if not 0 <= zoom <= metadata['max_zoom']:
+        return None
+    path = os.path.join(tiles_dir(image_path), str(zoom), f"{x}_{y}.jpg")
+    return path if os.path.exists(path) else None
+
+def build_previews(image_path):
+    """Write the downscaled previews of a heatmap image (widths smaller than the image only)."""
+    image = cv2.imread(image_path)
+    if image is None:
+        raise ValueError(f"Could not load heatmap image: {image_path}")
+    height, width = image.shape[:2]
+    for preview_width in PREVIEW_WIDTHS:
+        if preview_width >= width:
+            break
+        preview = cv2.resize(
+            image, (preview_width, max(1, round(height * preview_width / width))), interpolation=cv2.INTER_AREA
+        )
+        _write_jpeg(preview_path(image_path, preview_width), preview)
+
+def image_for_width(image_path, width):
+    """
+    Smallest version of a heatmap image at least `width` pixels wide (the full image if none is).
+    Previews are built on first use.
+    """
+    if not width:
+        return image_path
+    for preview_width in PREVIEW_WIDTHS:
+        if preview_width >= width:
+            path = preview_path(image_path, preview_width)
+            if not os.path.exists(path):
+                build_previews(image_path)
+            # Images narrower than the preview have no preview, serve them as they are
+            return path if os.path.exists(path) else image_path
+    return image_path
@@ -0,0 +1,116 @@
+"""
+time_series.py
+Per-bin detection and visitor counts of a job at several time granularities, used for peak-hour analysis.
+"""
+
+import os
+import json
+import numpy as np
+
+# Granularities (in minutes) the time series is computed at
+TIME_SERIES_BIN_MINUTES = (1, 5, 15, 60)
+# Granularity used for the peak hours of the analysis
+PEAK_BIN_MINUTES = 5
+# Series peak hours are ranked by: distinct visitors, not detection rows (a person
+# standing still for a minute adds a detection on every frame)
+PEAK_METRIC = 'visitors'
+
+def build_time_series(detections, bin_minutes=TIME_SERIES_BIN_MINUTES):
+    """
+    Count detections and distinct visitors (track IDs) per time bin.
+
+    Args:
+        detections: List of detections with 'timestamp' (seconds) and 'track_id',
+            or a detections table (see detection_store)
+        bin_minutes: Bin sizes in minutes to compute the series for
+
+    Returns:
+        dict with 'total_visitors' and, under 'series', one entry per bin size
+        (keyed by the size as a string) holding the 'detections' and 'visitors'
+        count per bin
+    """
+    if isinstance(detections, np.ndarray):
+        detections = detections[~np.isnan(detections['timestamp'])]
+        timestamps = np.asarray(detections['timestamp'], dtype=np.float64)
+        # Renumber the track IDs present 0..num_visitors-1
+        track_ids, visitor_ids = np.unique(detections['track_id'], return_inverse=True)
+        visitor_ids = visitor_ids.astype(np.int64)
+        num_visitors = len(track_ids)
+    else:
+        detections = [det for det in detections if 'timestamp' in det]
+        timestamps = np.array([det['timestamp'] for det in detections], dtype=np.float64)
+        # Number the distinct track IDs 0..num_visitors-1
+        id_numbers = {}
+        visitor_ids = np.fromiter(
+            (id_numbers.setdefault(det.get('track_id'), len(id_numbers)) for det in detections),
+            dtype=np.int64, count=len(detections)
+        )
+        num_visitors = len(id_numbers)
+
+    series = {}
+    for minutes in bin_minutes:
+        bins = (timestamps // (minutes * 60)).astype(np.int64)
+        num_bins = int(bins.max()) + 1 if len(bins) else 0
+        detection_counts = np.bincount(bins, minlength=num_bins)
+        # Each (bin, visitor) pair counts once
+        pairs = np.unique(bins * num_visitors + visitor_ids)
+        visitor_counts = np.bincount(pairs // max(num_visitors, 1), minlength=num_bins)
+        series[str(minutes)] = {
+            'bin_minutes': minutes,
+            'detections': detection_counts.tolist(),
+            'visitors': visitor_counts.tolist()
+        }
+    return {'total_visitors': num_visitors, 'series': series}
+
+def peak_bins(time_series, bin_minutes=PEAK_BIN_MINUTES, metric=PEAK_METRIC):
+    """
+    Find the busiest bin(s) at one granularity of a time series.
+
+    Args:
+        time_series: Time series built by build_time_series
+        bin_minutes: Granularity to search
+        metric: Series the bins are ranked by, 'visitors' (distinct track IDs) or 'detections'
+
+    Returns:
+        List of {'start_minute', 'end_minute', 'count', 'visitors', 'detections'} for the
+        busiest bins; 'count' is the value of `metric`
+    """
+    if metric not in ('visitors', 'detections'):
+        raise ValueError(f"Unknown peak metric: {metric}")
+    series = time_series['series'].get(str(bin_minutes))
+    if not series or not series[metric]:
+        return []
+    counts = np.array(series[metric], dtype=np.int64)
+    peak_count = int(counts.max())
+    return [
+        {
+            "start_minute": int(i) * bin_minutes,
+            "end_minute": (int(i) + 1) * bin_minutes,
+            "count": peak_count,
+            "visitors": series['visitors'][i],
+            "detections": series['detections'][i]
+        }
+        for i in np.flatnonzero(counts == peak_count)
+    ]
+
+def analyze_peak_hours(detections, fps=None, bin_minutes=PEAK_BIN_MINUTES, metric=PEAK_METRIC):
+    """
+    Analyze detections to find peak time frames.
+    - detections: list of dicts, each with a 'timestamp' (in seconds) and a 'track_id'
+    - fps: frames per second of the video (unused, timestamps are already in seconds)
+    - bin_minutes: size of each time bin in minutes
+    - metric: 'visitors' or 'detections', the count bins are ranked by
+    Returns: list of {'start_minute', 'end_minute', 'count', 'visitors', 'detections'} for the busiest bins
+    """
+    return peak_bins(build_time_series(detections, (bin_minutes,)), bin_minutes, metric)
+
+def save_time_series(time_series, path):
+    with open(path, 'w') as f:
+        json.dump(time_series, f)
+
+def load_time_series(path):
+    """Load a cached time series, or return None if there is none."""
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        return json.load(f)
@@ -0,0 +1,203 @@
+"""
+trackers.py
+Person trackers used by object tracking, behind a common interface.
+
+Every tracker takes detections as ([left, top, width, height], confidence, class_id)
+tuples and returns track objects with `track_id`, `is_confirmed()` and `to_ltrb()`:
+    update(detections, frame) -> tracks   associate this frame's detections
+    predict() -> tracks                   advance all tracks one frame without detections
+predict() is for frames skipped by the detection stride: it moves the tracks
+along their motion model but does not count the frame as a missed detection,
+so tentative tracks can still be confirmed and MAX_AGE counts detection frames.
+"""
+
+import os
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+from deep_sort_realtime.deepsort_tracker import DeepSort
+
+# Tracker used when a job does not choose one: 'deepsort' or 'iou'
+DEFAULT_TRACKER = os.getenv('TRACKER', 'deepsort')
+TRACKERS = ('deepsort', 'iou')
+
+# Frames a track may go without a matched detection before it is deleted
+MAX_AGE = 30
+
+class DeepSortTracker:
+    """DeepSORT with its appearance-embedding CNN (deep_sort_realtime)."""
+
+    # Minimum YOLO confidence for a detection to be passed to the tracker
+    min_confidence = 0.5
+
+    def __init__(self, max_age=MAX_AGE):
+        self._deepsort = DeepSort(max_age=max_age)
+
+    def update(self, detections, frame):
+        return self._deepsort.update_tracks(detections, frame=frame)
+
+    def predict(self):
+        # deep_sort counts every predict as a miss, and its IoU matching rejects tracks
+        # that missed more than once; restore the counter so skipped frames are not misses
+        tracks = self._deepsort.tracker.tracks
+        misses = [track.time_since_update for track in tracks]
+        self._deepsort.tracker.predict()
+        for track, time_since_update in zip(tracks, misses):
+            track.time_since_update = time_since_update
+        return tracks
+
+# Constant-velocity Kalman filter over (center x, center y, aspect ratio, height),
+# with the noise model used by DeepSORT and ByteTrack
+_STD_WEIGHT_POSITION = 1. / 20
+_STD_WEIGHT_VELOCITY = 1. / 160
+_MOTION = np.eye(8)
+_MOTION[:4, 4:] = np.eye(4)
+_PROJECTION = np.eye(4, 8)
+
+def _ltwh_to_xyah(ltwh):
+    left, top, width, height = ltwh
+    return np.array([left + width / 2, top + height / 2, width / max(height, 1e-6), height], dtype=float)
+
+class _KalmanTrack:
+    """A track of the IoU tracker, following one person with a Kalman filter."""
+
+    def __init__(self, ltwh, track_id, n_init):
+        measurement = _ltwh_to_xyah(ltwh)
+        self.mean = np.r_[measurement, np.zeros(4)]
+        h = measurement[3]
+        std = [2 * _STD_WEIGHT_POSITION * h, 2 * _STD_WEIGHT_POSITION * h, 1e-2, 2 * _STD_WEIGHT_POSITION * h,
+               10 * _STD_WEIGHT_VELOCITY * h, 10 * _STD_WEIGHT_VELOCITY * h, 1e-5, 10 * _STD_WEIGHT_VELOCITY * h]
+        self.covariance = np.diag(np.square(std))
+        self.track_id = str(track_id)
+        self.hits = 1
+        self.time_since_update = 0
+        self._n_init = n_init
+
+    def predict(self, miss=True):
+        """Advance the filter one frame; `miss` counts the frame as one without a matching detection."""
+        h = self.mean[3]
+        std = [_STD_WEIGHT_POSITION * h, _STD_WEIGHT_POSITION * h, 1e-2, _STD_WEIGHT_POSITION * h,
+               _STD_WEIGHT_VELOCITY * h, _STD_WEIGHT_VELOCITY * h, 1e-5, _STD_WEIGHT_VELOCITY * h]
+        self.mean = _MOTION @ self.mean
+        self.covariance = _MOTION @ self.covariance @ _MOTION.T + np.diag(np.square(std))
+        if miss:
+            self.time_since_update += 1
+
+    def update(self, ltwh):
+        h = self.mean[3]
+        std = [_STD_WEIGHT_POSITION * h, _STD_WEIGHT_POSITION * h, 1e-1, _STD_WEIGHT_POSITION * h]
+        projected_cov = _PROJECTION @ self.covariance @ _PROJECTION.T + np.diag(np.square(std))
+        gain = np.linalg.solve(projected_cov, _PROJECTION @ self.covariance).T
+        self.mean = self.mean + gain @ (_ltwh_to_xyah(ltwh) - _PROJECTION @ self.mean)
+        self.covariance = self.covariance - gain @ projected_cov @ gain.T
+        self.hits += 1
+        self.time_since_update = 0
+
+    def is_confirmed(self):
+        return self.hits >= self._n_init
+
+    def to_ltrb(self):
+        x, y, a, h = self.mean[:4]
+        w = a * h
+        return np.array([x - w / 2, y - h / 2, x + w / 2, y + h / 2])
+
+def _iou_matrix(boxes_a, boxes_b):
+    """Pairwise IoU of two (N, 4) and (M, 4) arrays of [x1, y1, x2, y2] boxes."""
+    if len(boxes_a) == 0 or len(boxes_b) == 0:
+        return np.zeros((len(boxes_a), len(boxes_b)))
+    top_left = np.maximum(boxes_a[:, None, :2], boxes_b[None, :, :2])
+    bottom_right = np.minimum(boxes_a[:, None, 2:], boxes_b[None, :, 2:])
+    inter = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    area_a = np.prod(boxes_a[:, 2:] - boxes_a[:, :2], axis=1)
+    area_b = np.prod(boxes_b[:, 2:] - boxes_b[:, :2], axis=1)
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-6)
+
+def _associate(tracks, boxes, min_iou):
+    """
+    Match tracks to detection boxes by IoU with the Hungarian algorithm.
+
+    Returns:
+        Tuple of (matched (track index, box index) pairs, unmatched track indices, unmatched box indices)
+    """
+    if not tracks or len(boxes) == 0:
+        return [], list(range(len(tracks))), list(range(len(boxes)))
+    ious = _iou_matrix(np.array([t.to_ltrb() for t in tracks]), boxes)
+    rows, cols = linear_sum_assignment(-ious)
+    matches = [(r, c) for r, c in zip(rows, cols) if ious[r, c] >= min_iou]
+    matched_tracks = set(r for r, _ in matches)
+    matched_boxes = set(c for _, c in matches)
+    return (matches,
+            [i for i in range(len(tracks)) if i not in matched_tracks],
+            [i for i in range(len(boxes)) if i not in matched_boxes])
+
+class IoUTracker:
+    """
+    Motion-only tracker with ByteTrack-style two-stage association.
+
+    Tracks are predicted with a Kalman filter and matched to detections by
+    IoU only, so no appearance CNN runs on the detection crops. High-confidence
+    detections are matched first; the remaining confirmed tracks are then
+    matched to the low-confidence detections, which keeps people tracked
+    through partial occlusion. Only high-confidence detections start new tracks.
+    """
+
+    # Low-confidence detections down to this score are used in the second association stage
+    min_confidence = 0.1
+    high_confidence = 0.5
+
+    def __init__(self, max_age=MAX_AGE, n_init=3, min_iou=0.2, low_min_iou=0.5):
+        self.max_age = max_age
+        self.n_init = n_init
+        self.min_iou = min_iou
+        self.low_min_iou = low_min_iou
+        self.tracks = []
+        self._next_id = 1
+
+    def predict(self):
+        for track in self.tracks:
+            track.predict(miss=False)
+        return self.tracks
+
+    def update(self, detections, frame=None):
+        for track in self.tracks:
+            track.predict()
+        if detections:
+            ltwh = np.array([det[0] for det in detections], dtype=float)
+            scores = np.array([det[1] for det in detections], dtype=float)
+        else:
+            ltwh = np.zeros((0, 4))
+            scores = np.zeros(0)
+        ltrb = np.c_[ltwh[:, :2], ltwh[:, :2] + ltwh[:, 2:]]
+        high = scores >= self.high_confidence
+
+        # Stage 1: all tracks against high-confidence detections
+        high_indices = np.flatnonzero(high)
+        matches, unmatched_tracks, unmatched_high = _associate(self.tracks, ltrb[high_indices], self.min_iou)
+        for t, d in matches:
+            self.tracks[t].update(ltwh[high_indices[d]])
+
+        # Stage 2: remaining confirmed tracks against low-confidence detections
+        remaining = [self.tracks[t] for t in unmatched_tracks if self.tracks[t].is_confirmed()]
+        low_indices = np.flatnonzero(~high)
+        low_matches, _, _ = _associate(remaining, ltrb[low_indices], self.low_min_iou)
+        for t, d in low_matches:
+            remaining[t].update(ltwh[low_indices[d]])
+
+        # Drop tentative tracks that missed and confirmed tracks that aged out
+        self.tracks = [
+            t for t in self.tracks
+            if t.time_since_update == 0 or (t.is_confirmed() and t.time_since_update <= self.max_age)
+        ]
+
+        # Start new tracks from unmatched high-confidence detections
+        for d in unmatched_high:
+            self.tracks.append(_KalmanTrack(ltwh[high_indices[d]], self._next_id, self.n_init))
+            self._next_id += 1
+        return self.tracks
+
+def create_tracker(name=DEFAULT_TRACKER):
+    """Create a tracker by name ('deepsort' or 'iou')."""
+    if name == 'deepsort':
+        return DeepSortTracker()
+    if name == 'iou':
+        return IoUTracker()
+    raise ValueError(f"Unknown tracker: {name}")
@@ -1,11 +1,42 @@
+"""
+video_overlay.py
+Draws tracking overlays (bounding boxes, track IDs) on video frames.
+"""
+
 import cv2
 
-def generate_video_overlay(detections, video_path, output_video_path):
+def draw_tracks(frame, detections):
+    """
+    Draw bounding boxes, track IDs and center dots on a frame.
+    detections: list of dicts with 'bbox' and 'track_id'
+    """
+    for detection in detections:
+        x1, y1, x2, y2 = map(int, detection['bbox'])
+        track_id = detection['track_id']
+
+        # Draw bounding box and ID with better contrast
+        cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
+
+        # Add black background for text (ID)
+        text = f"ID: {track_id}"
+        (text_width, text_height), _ = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, 0.9, 2)
+        cv2.rectangle(frame, (x1, y1-text_height-10), (x1+text_width, y1), (0, 0, 0), -1)
+        cv2.putText(frame, text, (x1, y1-5),
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.9, (255, 255, 255), 2)
+
+        # Draw a small white dot at the center of the box
+        center_x = int((x1 + x2) / 2)
+        center_y = int((y1 + y2) / 2)
+        cv2.circle(frame, (center_x, center_y), 4, (255, 255, 255), -1)
+
+def generate_video_overlay(detections, video_path, output_video_path, progress_callback=None):
     """
     Generate a processed video with overlays (bounding boxes, track IDs) using detection data.
+    Only needed for explicit re-renders; jobs draw the overlay while tracking.
     detections: list of dicts with 'frame', 'bbox', 'track_id'
     video_path: path to the input video
     output_video_path: path to save the processed video
+    progress_callback: optional callback function(progress) to report progress
     """
     cap = cv2.VideoCapture(video_path)
     if not cap.isOpened():
@@ -14,6 +45,7 @@ def generate_video_overlay(detections, video_path, output_video_path):
     width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
     height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
     fps = cap.get(cv2.CAP_PROP_FPS)
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
     fourcc = cv2.VideoWriter_fourcc(*'mp4v')
     out = cv2.VideoWriter(output_video_path, fourcc, fps, (width, height))
 
@@ -32,14 +64,12 @@ def generate_video_overlay(detections, video_path, output_video_path):
             break
         # Draw detections for current frame
         if frame_count in frame_detections:
-            for detection in frame_detections[frame_count]:
-                bbox = detection['bbox']
-                track_id = detection['track_id']
-                # Draw bounding box
-                cv2.rectangle(frame, (int(bbox[0]), int(bbox[1])), (int(bbox[2]), int(bbox[3])), (0, 255, 0), 2)
-                # Draw track ID
-                cv2.putText(frame, f"ID: {track_id}", (int(bbox[0]), int(bbox[1] - 10)), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+            draw_tracks(frame, frame_detections[frame_count])
         out.write(frame)
         frame_count += 1
+        if progress_callback and total_frames > 0 and frame_count % 10 == 0:
+            progress_callback(min(1.0, frame_count / total_frames))
     cap.release()
-    out.release() 
\ No newline at end of file
+    out.release()
+    if progress_callback:
+        progress_callback(1.0)